@@ -1,214 +1,237 @@
-use std::collections::BTreeMap;
-
 use crate::metrics::{MetricKind, MetricSample};
 use serde_json::json;
 
-fn sum_or_none(values: impl Iterator<Item = Option<f64>>) -> Option<f64> {
-    let mut total = 0.0;
-    let mut has_value = false;
-    for value in values.flatten() {
-        total += value;
-        has_value = true;
+const PERCENTAGE: usize = 0;
+const CAPACITY: usize = 1;
+const HEALTH: usize = 2;
+const ENERGY_NOW: usize = 3;
+const ENERGY_FULL: usize = 4;
+const ENERGY_FULL_DESIGN: usize = 5;
+const BATTERY_SLOTS: usize = 6;
+
+/// Index of a battery kind in [`BatteryTotals`]; `None` for every other kind,
+/// which passes through aggregation untouched.
+fn battery_slot(kind: &MetricKind) -> Option<usize> {
+    match kind {
+        MetricKind::BatteryPercentage => Some(PERCENTAGE),
+        MetricKind::BatteryCapacity => Some(CAPACITY),
+        MetricKind::BatteryHealth => Some(HEALTH),
+        MetricKind::BatteryEnergyNow => Some(ENERGY_NOW),
+        MetricKind::BatteryEnergyFull => Some(ENERGY_FULL),
+        MetricKind::BatteryEnergyFullDesign => Some(ENERGY_FULL_DESIGN),
+        _ => None,
     }
-    has_value.then_some(total)
 }
 
-fn avg_or_none(values: impl Iterator<Item = Option<f64>>) -> Option<f64> {
-    let mut total = 0.0;
-    let mut count = 0u64;
-    for value in values.flatten() {
-        total += value;
-        count += 1;
+/// Running sums and counts for every battery kind of one timestamp, kept as
+/// parallel arrays indexed by [`battery_slot`] so a group is folded in a
+/// single pass instead of one filtered copy per kind.
+#[derive(Default)]
+struct BatteryTotals {
+    sums: [f64; BATTERY_SLOTS],
+    counts: [u32; BATTERY_SLOTS],
+}
+
+impl BatteryTotals {
+    fn record(&mut self, slot: usize, value: Option<f64>) {
+        if let Some(value) = value {
+            self.sums[slot] += value;
+            self.counts[slot] += 1;
+        }
     }
-    if count == 0 {
-        None
-    } else {
-        Some(total / count as f64)
+
+    fn sum(&self, slot: usize) -> Option<f64> {
+        (self.counts[slot] > 0).then_some(self.sums[slot])
+    }
+
+    fn avg(&self, slot: usize) -> Option<f64> {
+        (self.counts[slot] > 0).then(|| self.sums[slot] / self.counts[slot] as f64)
     }
 }
 
 fn percent(numerator: Option<f64>, denominator: Option<f64>) -> Option<f64> {
     match (numerator, denominator) {
-        (Some(num), Some(den)) if den != 0.0 => Some((num / den) * 100.0),
+        (Some(num), Some(den)) if den != 0.0 => Some(num * 100.0 / den),
         _ => None,
     }
 }
 
-pub fn aggregate_multi_device_metrics(metrics: &[MetricSample]) -> Vec<MetricSample> {
-    if metrics.is_empty() {
-        return Vec::new();
-    }
-
-    let battery_kinds = [
-        MetricKind::BatteryPercentage,
-        MetricKind::BatteryCapacity,
-        MetricKind::BatteryHealth,
-        MetricKind::BatteryEnergyNow,
-        MetricKind::BatteryEnergyFull,
-        MetricKind::BatteryEnergyFullDesign,
-    ];
-
-    let needs_aggregation = metrics.iter().any(|m| battery_kinds.contains(&m.kind));
+/// Combines per-battery rows sharing a timestamp into one row per kind.
+/// Takes the samples by value: input without battery rows is returned as-is,
+/// and otherwise non-battery rows are moved into the result, not cloned.
+pub fn aggregate_multi_device_metrics(mut metrics: Vec<MetricSample>) -> Vec<MetricSample> {
+    let needs_aggregation = metrics.iter().any(|m| battery_slot(&m.kind).is_some());
 
     if !needs_aggregation {
-        return metrics.to_vec();
+        return metrics;
     }
 
-    let mut by_timestamp: BTreeMap<ordered_float::OrderedFloat<f64>, Vec<&MetricSample>> =
-        BTreeMap::new();
-    for metric in metrics {
-        by_timestamp
-            .entry(ordered_float::OrderedFloat(metric.ts))
-            .or_default()
-            .push(metric);
+    // Rows come back from SQL ordered by `ts`, so this stable sort is close to
+    // a single linear pass; each timestamp then forms one contiguous run and
+    // keeps its original row order.
+    metrics.sort_by(|a, b| a.ts.total_cmp(&b.ts));
+
+    // Non-battery rows map 1:1 and each battery group collapses to at most one
+    // row per kind, so the input length is a close upper bound for the output.
+    // The per-group battery and source-order buffers are reused across
+    // timestamps.
+    let mut aggregated = Vec::with_capacity(metrics.len());
+    let mut battery_rows: Vec<MetricSample> = Vec::new();
+    let mut source_order: Vec<usize> = Vec::new();
+    let mut rows = metrics.into_iter().peekable();
+    while let Some(first) = rows.next() {
+        let ts = first.ts;
+        battery_rows.clear();
+        let group =
+            std::iter::once(first).chain(std::iter::from_fn(|| rows.next_if(|m| m.ts == ts)));
+        for metric in group {
+            if battery_slot(&metric.kind).is_some() {
+                battery_rows.push(metric);
+            } else {
+                aggregated.push(metric);
+            }
+        }
+        if !battery_rows.is_empty() {
+            push_combined_battery_rows(ts, &battery_rows, &mut source_order, &mut aggregated);
+        }
     }
 
-    let mut aggregated = Vec::new();
-    for (ts_key, group) in by_timestamp {
-        let ts = ts_key.0;
+    aggregated
+}
 
-        for metric in &group {
-            if !battery_kinds.contains(&metric.kind) {
-                aggregated.push((*metric).clone());
+/// Appends the combined rows for one timestamp's battery samples: energies
+/// are summed, percentages derived from the sums, and the sources/status
+/// folded into a single label. `source_order` is caller-owned scratch space
+/// for sorting the sources, reused across timestamps.
+fn push_combined_battery_rows(
+    ts: f64,
+    battery_rows: &[MetricSample],
+    source_order: &mut Vec<usize>,
+    aggregated: &mut Vec<MetricSample>,
+) {
+    // One pass feeds the totals plus the status for the combined row.
+    // Once two different statuses are seen the result is "mixed", so the
+    // remaining status lookups are skipped.
+    let mut totals = BatteryTotals::default();
+    let mut status: Option<&str> = None;
+    let mut mixed = false;
+    for metric in battery_rows {
+        let slot = battery_slot(&metric.kind).expect("battery_rows only holds battery kinds");
+        totals.record(slot, metric.value);
+        if mixed {
+            continue;
+        }
+        if let Some(current) = metric.details.get("status").and_then(|v| v.as_str()) {
+            match status {
+                None => status = Some(current),
+                Some(first) if first != current => mixed = true,
+                Some(_) => {}
             }
         }
+    }
 
-        let energy_now: Vec<&MetricSample> = group
-            .iter()
-            .filter(|m| m.kind == MetricKind::BatteryEnergyNow)
-            .copied()
-            .collect();
-        let energy_full: Vec<&MetricSample> = group
-            .iter()
-            .filter(|m| m.kind == MetricKind::BatteryEnergyFull)
-            .copied()
-            .collect();
-        let energy_full_design: Vec<&MetricSample> = group
-            .iter()
-            .filter(|m| m.kind == MetricKind::BatteryEnergyFullDesign)
-            .copied()
-            .collect();
-        let percentages: Vec<&MetricSample> = group
-            .iter()
-            .filter(|m| m.kind == MetricKind::BatteryPercentage)
-            .copied()
-            .collect();
-        let capacity: Vec<&MetricSample> = group
-            .iter()
-            .filter(|m| m.kind == MetricKind::BatteryCapacity)
-            .copied()
-            .collect();
-        let health: Vec<&MetricSample> = group
-            .iter()
-            .filter(|m| m.kind == MetricKind::BatteryHealth)
-            .copied()
-            .collect();
-
-        let sum_energy_now = sum_or_none(energy_now.iter().map(|m| m.value));
-        let sum_energy_full = sum_or_none(energy_full.iter().map(|m| m.value));
-        let sum_energy_full_design = sum_or_none(energy_full_design.iter().map(|m| m.value));
-
-        let mut sources: Vec<&str> = group.iter().map(|m| m.source.as_str()).collect();
-        sources.sort();
-        sources.dedup();
-        let combined_source = sources.join("+");
-
-        let mut statuses = std::collections::BTreeSet::new();
-        for metric in &group {
-            if let Some(status) = metric.details.get("status").and_then(|v| v.as_str()) {
-                statuses.insert(status);
-            }
+    let sum_energy_now = totals.sum(ENERGY_NOW);
+    let sum_energy_full = totals.sum(ENERGY_FULL);
+    let sum_energy_full_design = totals.sum(ENERGY_FULL_DESIGN);
+
+    // Single-battery machines repeat one source name for every row, so
+    // skip the sort/dedup/join unless several devices are present.
+    let source = |i: usize| battery_rows[i].source.as_str();
+    let combined_source = match battery_rows.split_first() {
+        Some((first, rest)) if rest.iter().all(|m| m.source == first.source) => {
+            first.source.clone()
         }
-        let status = if statuses.is_empty() {
-            None
-        } else if statuses.len() == 1 {
-            Some(statuses.into_iter().next().unwrap().to_string())
-        } else {
-            Some("mixed".to_string())
-        };
-
-        let details = json!({ "status": status });
-
-        let mut computed_percentage = percent(sum_energy_now, sum_energy_full);
-        if computed_percentage.is_none() {
-            computed_percentage = avg_or_none(percentages.iter().map(|m| m.value));
+        _ => {
+            source_order.clear();
+            source_order.extend(0..battery_rows.len());
+            source_order.sort_unstable_by_key(|&i| source(i));
+            source_order.dedup_by_key(|i| source(*i));
+            let mut combined = String::new();
+            for (n, &i) in source_order.iter().enumerate() {
+                if n > 0 {
+                    combined.push('+');
+                }
+                combined.push_str(source(i));
+            }
+            combined
         }
+    };
 
-        let mut computed_health = percent(sum_energy_full, sum_energy_full_design);
-        if computed_health.is_none() {
-            computed_health = avg_or_none(health.iter().map(|m| m.value));
-        }
+    let status = if mixed { Some("mixed") } else { status };
+    let details = json!({ "status": status });
 
-        let avg_capacity = avg_or_none(capacity.iter().map(|m| m.value));
-
-        if let Some(pct) = computed_percentage {
-            aggregated.push(MetricSample::new(
-                ts,
-                MetricKind::BatteryPercentage,
-                &combined_source,
-                Some(pct),
-                Some("%"),
-                details.clone(),
-            ));
-        }
+    let computed_percentage =
+        percent(sum_energy_now, sum_energy_full).or_else(|| totals.avg(PERCENTAGE));
+    let computed_health =
+        percent(sum_energy_full, sum_energy_full_design).or_else(|| totals.avg(HEALTH));
 
-        if let Some(cap) = avg_capacity {
-            aggregated.push(MetricSample::new(
-                ts,
-                MetricKind::BatteryCapacity,
-                &combined_source,
-                Some(cap),
-                Some("%"),
-                details.clone(),
-            ));
-        }
+    let avg_capacity = totals.avg(CAPACITY);
 
-        if let Some(h) = computed_health {
-            aggregated.push(MetricSample::new(
-                ts,
-                MetricKind::BatteryHealth,
-                &combined_source,
-                Some(h),
-                Some("%"),
-                details.clone(),
-            ));
-        }
+    if let Some(pct) = computed_percentage {
+        aggregated.push(MetricSample::new(
+            ts,
+            MetricKind::BatteryPercentage,
+            &combined_source,
+            Some(pct),
+            Some("%"),
+            details.clone(),
+        ));
+    }
 
-        if let Some(e) = sum_energy_now {
-            aggregated.push(MetricSample::new(
-                ts,
-                MetricKind::BatteryEnergyNow,
-                &combined_source,
-                Some(e),
-                Some("Wh"),
-                details.clone(),
-            ));
-        }
+    if let Some(cap) = avg_capacity {
+        aggregated.push(MetricSample::new(
+            ts,
+            MetricKind::BatteryCapacity,
+            &combined_source,
+            Some(cap),
+            Some("%"),
+            details.clone(),
+        ));
+    }
 
-        if let Some(e) = sum_energy_full {
-            aggregated.push(MetricSample::new(
-                ts,
-                MetricKind::BatteryEnergyFull,
-                &combined_source,
-                Some(e),
-                Some("Wh"),
-                details.clone(),
-            ));
-        }
+    if let Some(h) = computed_health {
+        aggregated.push(MetricSample::new(
+            ts,
+            MetricKind::BatteryHealth,
+            &combined_source,
+            Some(h),
+            Some("%"),
+            details.clone(),
+        ));
+    }
 
-        if let Some(e) = sum_energy_full_design {
-            aggregated.push(MetricSample::new(
-                ts,
-                MetricKind::BatteryEnergyFullDesign,
-                &combined_source,
-                Some(e),
-                Some("Wh"),
-                details.clone(),
-            ));
-        }
+    if let Some(e) = sum_energy_now {
+        aggregated.push(MetricSample::new(
+            ts,
+            MetricKind::BatteryEnergyNow,
+            &combined_source,
+            Some(e),
+            Some("Wh"),
+            details.clone(),
+        ));
     }
 
-    aggregated
+    if let Some(e) = sum_energy_full {
+        aggregated.push(MetricSample::new(
+            ts,
+            MetricKind::BatteryEnergyFull,
+            &combined_source,
+            Some(e),
+            Some("Wh"),
+            details.clone(),
+        ));
+    }
+
+    if let Some(e) = sum_energy_full_design {
+        aggregated.push(MetricSample::new(
+            ts,
+            MetricKind::BatteryEnergyFullDesign,
+            &combined_source,
+            Some(e),
+            Some("Wh"),
+            details.clone(),
+        ));
+    }
 }
 
 #[cfg(test)]
@@ -238,6 +261,14 @@ mod tests {
         }
     }
 
+    #[test]
+    fn percent_guards_missing_and_zero_denominators() {
+        assert_eq!(percent(Some(1.0), Some(3.0)), Some(100.0 / 3.0));
+        assert_eq!(percent(Some(1.0), Some(0.0)), None);
+        assert_eq!(percent(None, Some(3.0)), None);
+        assert_eq!(percent(Some(1.0), None), None);
+    }
+
     #[test]
     fn aggregate_multi_device_metrics_combines_multiple_batteries() {
         let metrics = vec![
@@ -281,7 +312,7 @@ mod tests {
             battery_metric(1.0, MetricKind::BatteryCapacity, "BAT1", 95.0, "Charging"),
         ];
 
-        let aggregated = aggregate_multi_device_metrics(&metrics);
+        let aggregated = aggregate_multi_device_metrics(metrics);
 
         let energy_now = aggregated
             .iter()
@@ -324,6 +355,20 @@ mod tests {
         assert_eq!(status, Some("mixed"));
     }
 
+    #[test]
+    fn aggregate_multi_device_metrics_keeps_shared_status() {
+        let metrics = vec![
+            battery_metric(1.0, MetricKind::BatteryEnergyNow, "BAT0", 5.0, "Full"),
+            battery_metric(1.0, MetricKind::BatteryEnergyNow, "BAT1", 6.0, "Full"),
+        ];
+
+        let aggregated = aggregate_multi_device_metrics(metrics);
+
+        assert_eq!(aggregated.len(), 1);
+        let status = aggregated[0].details.get("status").unwrap().as_str();
+        assert_eq!(status, Some("Full"));
+    }
+
     #[test]
     fn aggregate_multi_device_metrics_groups_by_timestamp() {
         let metrics = vec![
@@ -392,7 +437,7 @@ mod tests {
             ),
         ];
 
-        let aggregated = aggregate_multi_device_metrics(&metrics);
+        let aggregated = aggregate_multi_device_metrics(metrics);
 
         let ts1_metrics: Vec<_> = aggregated.iter().filter(|m| m.ts == 1.0).collect();
         let ts2_metrics: Vec<_> = aggregated.iter().filter(|m| m.ts == 2.0).collect();
@@ -412,4 +457,56 @@ mod tests {
             .unwrap();
         assert_eq!(ts2_energy_now.value, Some(2.0));
     }
+
+    #[test]
+    fn aggregate_multi_device_metrics_sources_only_batteries() {
+        let metrics = vec![
+            battery_metric(
+                1.0,
+                MetricKind::BatteryEnergyNow,
+                "BAT0",
+                10.0,
+                "Discharging",
+            ),
+            MetricSample {
+                ts: 1.0,
+                kind: MetricKind::PowerDraw,
+                source: "hwmon0:power1".to_string(),
+                value: Some(7.5),
+                unit: Some("W".to_string()),
+                details: serde_json::Value::Null,
+            },
+        ];
+
+        let aggregated = aggregate_multi_device_metrics(metrics);
+
+        let energy_now = aggregated
+            .iter()
+            .find(|m| m.kind == MetricKind::BatteryEnergyNow)
+            .unwrap();
+        assert_eq!(energy_now.source, "BAT0");
+        let power = aggregated
+            .iter()
+            .find(|m| m.kind == MetricKind::PowerDraw)
+            .unwrap();
+        assert_eq!(power.source, "hwmon0:power1");
+    }
+
+    #[test]
+    fn aggregate_multi_device_metrics_reuses_input_without_batteries() {
+        let metrics = vec![MetricSample {
+            ts: 1.0,
+            kind: MetricKind::CpuUsage,
+            source: "cpu".to_string(),
+            value: Some(12.0),
+            unit: Some("%".to_string()),
+            details: serde_json::Value::Null,
+        }];
+
+        let buffer = metrics.as_ptr();
+        let aggregated = aggregate_multi_device_metrics(metrics);
+
+        assert_eq!(aggregated.as_ptr(), buffer);
+        assert_eq!(aggregated.len(), 1);
+    }
 }
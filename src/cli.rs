@@ -2,6 +2,7 @@ use std::collections::BTreeMap;
 use std::ffi::OsString;
 use std::io::Write;
 use std::path::PathBuf;
+use std::sync::{Once, OnceLock};
 
 use anyhow::Result;
 use clap::{Parser, Subcommand};
@@ -9,11 +10,13 @@ use comfy_table::modifiers::UTF8_ROUND_CORNERS;
 use comfy_table::presets::UTF8_FULL_CONDENSED;
 use comfy_table::{Attribute, Cell, CellAlignment, Color, ContentArrangement, Table};
 
-use chrono::{DateTime, Local};
+use chrono::format::{Item, StrftimeItems};
+use chrono::Local;
 
 use crate::cli_helpers::{
-    average_rates, bucket_span_seconds, bucket_start, default_graph_path, estimate_runtime_hours,
-    format_runtime, is_charging, is_discharging, MAX_GAP_HOURS,
+    average_rates, average_rates_from_segments, bucket_datetime, bucket_runs, bucket_span_seconds,
+    counter_delta, data_span_seconds, default_graph_path, detail_number, estimate_runtime_hours,
+    format_runtime, rate_segments, BucketAligner, RateSegment, SamplesByKind,
 };
 use crate::collector::{collect_loop, collect_once, resolve_db_path};
 use crate::db;
@@ -89,15 +92,20 @@ pub enum Commands {
     },
 }
 
+/// The global logger can only be installed once per process, so repeated
+/// `run` calls skip rebuilding the env_logger configuration entirely.
 fn configure_logging(verbose: bool) {
-    let mut builder = env_logger::Builder::from_env(env_logger::Env::default());
-    builder.format(|buf, record| writeln!(buf, "{}", record.args()));
-    if verbose {
-        builder.filter_level(log::LevelFilter::Debug);
-    } else {
-        builder.filter_level(log::LevelFilter::Info);
-    }
-    let _ = builder.try_init();
+    static LOGGING: Once = Once::new();
+    LOGGING.call_once(|| {
+        let mut builder = env_logger::Builder::from_env(env_logger::Env::default());
+        builder.format(|buf, record| writeln!(buf, "{}", record.args()));
+        if verbose {
+            builder.filter_level(log::LevelFilter::Debug);
+        } else {
+            builder.filter_level(log::LevelFilter::Info);
+        }
+        let _ = builder.try_init();
+    });
 }
 
 fn preset_kinds(preset: ReportPreset) -> &'static [MetricKind] {
@@ -206,8 +214,8 @@ where
             let metric_kinds = metric_kinds_for_presets(&presets);
 
             let conn = db::init_db_connection(&resolved)?;
-            let metric_total = db::count_metric_samples_with_conn(&conn, None)?;
-            if metric_total == 0 {
+            db::tune_for_reads_with_conn(&conn)?;
+            if !db::has_metric_samples_with_conn(&conn)? {
                 return Err(anyhow::anyhow!("No records available; collect data first."));
             }
 
@@ -219,8 +227,8 @@ where
             // Filter by `--sensor` BEFORE multi-battery aggregation: otherwise
             // `--sensor BAT0` matches nothing because aggregation already
             // combined BAT0+BAT1 into a single "BAT0+BAT1" source string.
-            let filtered_raw = filter_metrics_by_source(&raw_metrics, &sensor_filters);
-            let metric_samples = crate::aggregate::aggregate_multi_device_metrics(&filtered_raw);
+            let filtered_raw = filter_metrics_by_source(raw_metrics, &sensor_filters);
+            let metric_samples = crate::aggregate::aggregate_multi_device_metrics(filtered_raw);
 
             let has_selected_data = presets
                 .iter()
@@ -270,28 +278,16 @@ fn summarize(
     let timeframe_label = timeframe.label.replace('_', " ");
     let bucket_seconds = bucket_span_seconds(timeframe, data_span_seconds(metrics));
 
-    let battery_metrics: Vec<MetricSample> = metrics
-        .iter()
-        .filter(|m| {
-            matches!(
-                m.kind,
-                MetricKind::BatteryPercentage
-                    | MetricKind::BatteryCapacity
-                    | MetricKind::BatteryHealth
-                    | MetricKind::BatteryEnergyNow
-                    | MetricKind::BatteryEnergyFull
-                    | MetricKind::BatteryEnergyFullDesign
-            )
-        })
-        .cloned()
-        .collect();
+    let samples = SamplesByKind::new(metrics);
+    let battery_metrics = &samples.battery;
 
-    let battery_rates = average_rates(&battery_metrics);
-    let power_draw_stats = average_for_kind(metrics, MetricKind::PowerDraw);
+    let segments = rate_segments(battery_metrics.iter().copied());
+    let battery_rates = average_rates_from_segments(&segments);
+    let power_draw_stats = average_value(samples.of(MetricKind::PowerDraw));
     let avg_discharge_w = power_draw_stats.average().or(battery_rates.discharge_w);
-    let est_runtime_hours = estimate_runtime_hours(avg_discharge_w, &battery_metrics);
-    let power_draw_by_bucket =
-        bucket_stats_for_kind(metrics, MetricKind::PowerDraw, bucket_seconds);
+    let est_runtime_hours =
+        estimate_runtime_hours(avg_discharge_w, battery_metrics.iter().copied());
+    let power_draw_by_bucket = bucket_stats(samples.of(MetricKind::PowerDraw), bucket_seconds);
 
     if presets.contains(&ReportPreset::Battery) {
         println!(
@@ -308,13 +304,12 @@ fn summarize(
         if battery_metrics.is_empty() {
             println!("\nNo battery samples available for buckets in {timeframe_label}.");
         } else {
-            let (discharge_rates, charge_rates) =
-                battery_rate_buckets(&battery_metrics, bucket_seconds);
+            let (discharge_rates, charge_rates) = battery_rate_buckets(&segments, bucket_seconds);
             println!(
                 "\nBattery stats ({})\n{}",
                 timeframe.label.replace('_', " "),
                 battery_stats_table(
-                    &battery_metrics,
+                    battery_metrics,
                     &power_draw_by_bucket,
                     &discharge_rates,
                     &charge_rates,
@@ -326,9 +321,9 @@ fn summarize(
 
     if presets.contains(&ReportPreset::Cpu) {
         let usage_buckets =
-            bucket_stats_for_kind_by_source(metrics, MetricKind::CpuUsage, bucket_seconds);
+            bucket_stats_by_source(samples.of(MetricKind::CpuUsage), bucket_seconds);
         let freq_buckets =
-            bucket_stats_for_kind_by_source(metrics, MetricKind::CpuFrequency, bucket_seconds);
+            bucket_stats_by_source(samples.of(MetricKind::CpuFrequency), bucket_seconds);
         if usage_buckets.is_empty() && freq_buckets.is_empty() {
             println!("\nNo CPU samples available for {timeframe_label}.");
         } else {
@@ -342,9 +337,9 @@ fn summarize(
 
     if presets.contains(&ReportPreset::Gpu) {
         let usage_buckets =
-            bucket_stats_for_kind_by_source(metrics, MetricKind::GpuUsage, bucket_seconds);
+            bucket_stats_by_source(samples.of(MetricKind::GpuUsage), bucket_seconds);
         let freq_buckets =
-            bucket_stats_for_kind_by_source(metrics, MetricKind::GpuFrequency, bucket_seconds);
+            bucket_stats_by_source(samples.of(MetricKind::GpuFrequency), bucket_seconds);
         if usage_buckets.is_empty() && freq_buckets.is_empty() {
             println!("\nNo GPU samples available for {timeframe_label}.");
         } else {
@@ -357,7 +352,8 @@ fn summarize(
     }
 
     if presets.contains(&ReportPreset::Memory) {
-        let memory_buckets = bucket_usage_stats(metrics, MetricKind::MemoryUsage, bucket_seconds);
+        let memory_buckets =
+            bucket_usage_stats(samples.of(MetricKind::MemoryUsage), bucket_seconds);
         if memory_buckets.is_empty() {
             println!("\nNo memory samples available for {timeframe_label}.");
         } else {
@@ -370,7 +366,7 @@ fn summarize(
     }
 
     if presets.contains(&ReportPreset::Disk) {
-        let disk_buckets = bucket_usage_stats(metrics, MetricKind::DiskUsage, bucket_seconds);
+        let disk_buckets = bucket_usage_stats(samples.of(MetricKind::DiskUsage), bucket_seconds);
         if disk_buckets.is_empty() {
             println!("\nNo disk samples available for {timeframe_label}.");
         } else {
@@ -383,7 +379,8 @@ fn summarize(
     }
 
     if presets.contains(&ReportPreset::Network) {
-        let network_buckets = bucket_network_totals(metrics, bucket_seconds);
+        let network_buckets =
+            bucket_network_totals(samples.of(MetricKind::NetworkBytes), bucket_seconds);
         if network_buckets.is_empty() {
             println!("\nNo network samples available for {timeframe_label}.");
         } else {
@@ -397,7 +394,7 @@ fn summarize(
 
     if presets.contains(&ReportPreset::Temperature) {
         let temp_buckets =
-            bucket_stats_for_kind_by_source(metrics, MetricKind::Temperature, bucket_seconds);
+            bucket_stats_by_source(samples.of(MetricKind::Temperature), bucket_seconds);
         if temp_buckets.is_empty() {
             println!("\nNo temperature samples available for {timeframe_label}.");
         } else {
@@ -445,6 +442,12 @@ fn value_cell<T: std::fmt::Display>(value: T) -> Cell {
     Cell::new(value.to_string()).set_alignment(CellAlignment::Right)
 }
 
+fn window_cell(key: i64, bucket_seconds: i64) -> Cell {
+    Cell::new(format_bucket(key, bucket_seconds))
+        .fg(Color::Magenta)
+        .add_attribute(Attribute::Bold)
+}
+
 fn status_cell(status: Option<&str>) -> Cell {
     let status_text = status.unwrap_or("unknown");
     let lower = status_text.to_ascii_lowercase();
@@ -538,39 +541,35 @@ impl TransferStats {
     }
 }
 
-fn average_for_kind(metrics: &[MetricSample], kind: MetricKind) -> NumberStats {
+fn average_value<'a>(samples: impl IntoIterator<Item = &'a MetricSample>) -> NumberStats {
     let mut stats = NumberStats::default();
-    for sample in metrics.iter().filter(|s| s.kind == kind) {
+    for sample in samples {
         stats.record_opt(sample.value);
     }
     stats
 }
 
 fn filter_metrics_by_source(
-    metrics: &[MetricSample],
+    mut metrics: Vec<MetricSample>,
     sensor_filters: &[String],
 ) -> Vec<MetricSample> {
-    if sensor_filters.is_empty() {
-        return metrics.to_vec();
+    if !sensor_filters.is_empty() {
+        metrics.retain(|m| sensor_filters.iter().any(|f| f == &m.source));
     }
     metrics
-        .iter()
-        .filter(|m| sensor_filters.iter().any(|f| f == &m.source))
-        .cloned()
-        .collect()
 }
 
-type SourceBuckets = BTreeMap<String, BTreeMap<DateTime<Local>, NumberStats>>;
+type SourceBuckets = BTreeMap<String, BTreeMap<i64, NumberStats>>;
 
-fn bucket_stats_for_kind_by_source(
-    metrics: &[MetricSample],
-    kind: MetricKind,
+fn bucket_stats_by_source<'a>(
+    samples: impl IntoIterator<Item = &'a MetricSample>,
     bucket_seconds: i64,
 ) -> SourceBuckets {
     let mut buckets: SourceBuckets = BTreeMap::new();
-    for sample in metrics.iter().filter(|s| s.kind == kind) {
+    let mut aligner = BucketAligner::new(bucket_seconds);
+    for sample in samples {
         if let Some(value) = sample.value {
-            let bucket = bucket_start(sample.ts, bucket_seconds);
+            let bucket = aligner.key(sample.ts);
             buckets
                 .entry(sample.source.clone())
                 .or_default()
@@ -582,31 +581,15 @@ fn bucket_stats_for_kind_by_source(
     buckets
 }
 
-fn data_span_seconds(metrics: &[MetricSample]) -> Option<f64> {
-    let mut min_ts = f64::INFINITY;
-    let mut max_ts = f64::NEG_INFINITY;
-
-    for ts in metrics.iter().map(|s| s.ts) {
-        min_ts = min_ts.min(ts);
-        max_ts = max_ts.max(ts);
-    }
-
-    if max_ts.is_finite() && min_ts.is_finite() && max_ts >= min_ts {
-        Some(max_ts - min_ts)
-    } else {
-        None
-    }
-}
-
-fn bucket_stats_for_kind(
-    metrics: &[MetricSample],
-    kind: MetricKind,
+fn bucket_stats<'a>(
+    samples: impl IntoIterator<Item = &'a MetricSample>,
     bucket_seconds: i64,
-) -> BTreeMap<DateTime<Local>, NumberStats> {
-    let mut buckets: BTreeMap<DateTime<Local>, NumberStats> = BTreeMap::new();
-    for sample in metrics.iter().filter(|s| s.kind == kind) {
+) -> BTreeMap<i64, NumberStats> {
+    let mut buckets: BTreeMap<i64, NumberStats> = BTreeMap::new();
+    let mut aligner = BucketAligner::new(bucket_seconds);
+    for sample in samples {
         if let Some(value) = sample.value {
-            let bucket = bucket_start(sample.ts, bucket_seconds);
+            let bucket = aligner.key(sample.ts);
             buckets.entry(bucket).or_default().record(value);
         }
     }
@@ -617,21 +600,21 @@ fn bucket_stats_for_kind(
 fn usage_stats_for_kind(metrics: &[MetricSample], kind: MetricKind) -> UsageStats {
     let mut stats = UsageStats::default();
     for sample in metrics.iter().filter(|s| s.kind == kind) {
-        let total = number_from_details(sample, "total_bytes");
+        let total = detail_number(sample, "total_bytes");
         stats.record(sample.value, total);
     }
     stats
 }
 
-fn bucket_usage_stats(
-    metrics: &[MetricSample],
-    kind: MetricKind,
+fn bucket_usage_stats<'a>(
+    samples: impl IntoIterator<Item = &'a MetricSample>,
     bucket_seconds: i64,
-) -> BTreeMap<DateTime<Local>, UsageStats> {
-    let mut buckets: BTreeMap<DateTime<Local>, UsageStats> = BTreeMap::new();
-    for sample in metrics.iter().filter(|s| s.kind == kind) {
-        let bucket = bucket_start(sample.ts, bucket_seconds);
-        let total = number_from_details(sample, "total_bytes");
+) -> BTreeMap<i64, UsageStats> {
+    let mut buckets: BTreeMap<i64, UsageStats> = BTreeMap::new();
+    let mut aligner = BucketAligner::new(bucket_seconds);
+    for sample in samples {
+        let bucket = aligner.key(sample.ts);
+        let total = detail_number(sample, "total_bytes");
         buckets
             .entry(bucket)
             .or_default()
@@ -675,13 +658,13 @@ fn compute_network_rates(metrics: &[MetricSample]) -> Vec<NetworkRateSample> {
                 continue;
             }
             let rx_rate = rate_from_counters(
-                number_from_details(prev, "rx_bytes"),
-                number_from_details(next, "rx_bytes"),
+                detail_number(prev, "rx_bytes"),
+                detail_number(next, "rx_bytes"),
                 dt,
             );
             let tx_rate = rate_from_counters(
-                number_from_details(prev, "tx_bytes"),
-                number_from_details(next, "tx_bytes"),
+                detail_number(prev, "tx_bytes"),
+                detail_number(next, "tx_bytes"),
                 dt,
             );
             if rx_rate.is_none() && tx_rate.is_none() {
@@ -693,26 +676,17 @@ fn compute_network_rates(metrics: &[MetricSample]) -> Vec<NetworkRateSample> {
     rates
 }
 
-fn compute_counter_delta(prev: Option<f64>, next: Option<f64>) -> f64 {
-    match (prev, next) {
-        (Some(prev_val), Some(next_val)) if next_val >= prev_val => next_val - prev_val,
-        _ => 0.0,
-    }
-}
-
-fn bucket_network_totals(
-    metrics: &[MetricSample],
+fn bucket_network_totals<'a>(
+    samples: impl IntoIterator<Item = &'a MetricSample>,
     bucket_seconds: i64,
-) -> BTreeMap<DateTime<Local>, TransferStats> {
+) -> BTreeMap<i64, TransferStats> {
     let mut by_iface: BTreeMap<&str, Vec<&MetricSample>> = BTreeMap::new();
-    for sample in metrics
-        .iter()
-        .filter(|s| s.kind == MetricKind::NetworkBytes)
-    {
+    for sample in samples {
         by_iface.entry(&sample.source).or_default().push(sample);
     }
 
-    let mut buckets: BTreeMap<DateTime<Local>, TransferStats> = BTreeMap::new();
+    let mut buckets: BTreeMap<i64, TransferStats> = BTreeMap::new();
+    let mut aligner = BucketAligner::new(bucket_seconds);
     for (_iface, mut samples) in by_iface {
         samples.sort_by(|a, b| a.ts.total_cmp(&b.ts));
         for window in samples.windows(2) {
@@ -723,17 +697,17 @@ fn bucket_network_totals(
                 continue;
             }
 
-            let rx_delta = compute_counter_delta(
-                number_from_details(prev, "rx_bytes"),
-                number_from_details(next, "rx_bytes"),
+            let rx_delta = counter_delta(
+                detail_number(prev, "rx_bytes"),
+                detail_number(next, "rx_bytes"),
             );
-            let tx_delta = compute_counter_delta(
-                number_from_details(prev, "tx_bytes"),
-                number_from_details(next, "tx_bytes"),
+            let tx_delta = counter_delta(
+                detail_number(prev, "tx_bytes"),
+                detail_number(next, "tx_bytes"),
             );
 
             if rx_delta > 0.0 || tx_delta > 0.0 {
-                let bucket = bucket_start(next.ts, bucket_seconds);
+                let bucket = aligner.key(next.ts);
                 buckets
                     .entry(bucket)
                     .or_default()
@@ -744,6 +718,12 @@ fn bucket_network_totals(
     buckets
 }
 
+fn format_temp(value: Option<f64>) -> String {
+    value
+        .map(|v| format!("{v:.1}C"))
+        .unwrap_or_else(|| "--".to_string())
+}
+
 fn format_freq(value: Option<f64>) -> String {
     value
         .map(|v| format!("{v:.0}MHz"))
@@ -758,90 +738,59 @@ fn battery_summary_table(
 ) -> Table {
     let mut table = themed_table();
     table.set_header(header_cells(&["Metric", "Value"]));
-    table.add_row(vec![
-        label_cell("Records in window"),
-        value_cell(timeframe_records),
-    ]);
-    table.add_row(vec![
-        label_cell("Avg discharge power"),
-        value_cell(format_power(avg_discharge_w)),
-    ]);
-    table.add_row(vec![
-        label_cell("Avg charge power"),
-        value_cell(format_power(avg_charge_w)),
-    ]);
-    table.add_row(vec![
-        label_cell("Est runtime (full)"),
-        value_cell(format_runtime(est_runtime_hours)),
+    table.add_rows([
+        vec![
+            label_cell("Records in window"),
+            value_cell(timeframe_records),
+        ],
+        vec![
+            label_cell("Avg discharge power"),
+            value_cell(format_power(avg_discharge_w)),
+        ],
+        vec![
+            label_cell("Avg charge power"),
+            value_cell(format_power(avg_charge_w)),
+        ],
+        vec![
+            label_cell("Est runtime (full)"),
+            value_cell(format_runtime(est_runtime_hours)),
+        ],
     ]);
     table
 }
 
 fn battery_rate_buckets(
-    battery_metrics: &[MetricSample],
+    segments: &[RateSegment],
     bucket_seconds: i64,
-) -> (
-    BTreeMap<DateTime<Local>, NumberStats>,
-    BTreeMap<DateTime<Local>, NumberStats>,
-) {
-    let mut discharge = BTreeMap::new();
-    let mut charge = BTreeMap::new();
-
-    let energy_now_samples: Vec<_> = battery_metrics
-        .iter()
-        .filter(|m| m.kind == MetricKind::BatteryEnergyNow && m.value.is_some())
-        .collect();
-
-    let mut iter = energy_now_samples.iter();
-    let mut previous = match iter.next() {
-        Some(sample) => sample,
-        None => return (discharge, charge),
-    };
-
-    for current in iter {
-        if current.ts < previous.ts {
-            previous = current;
-            continue;
-        }
-        let (Some(prev_now), Some(curr_now)) = (previous.value, current.value) else {
-            previous = current;
-            continue;
+) -> (BTreeMap<i64, NumberStats>, BTreeMap<i64, NumberStats>) {
+    let mut discharge: BTreeMap<i64, NumberStats> = BTreeMap::new();
+    let mut charge: BTreeMap<i64, NumberStats> = BTreeMap::new();
+
+    let mut aligner = BucketAligner::new(bucket_seconds);
+    for segment in segments {
+        let target = if segment.charging {
+            &mut charge
+        } else {
+            &mut discharge
         };
-        let dt_hours = (current.ts - previous.ts) / 3600.0;
-        if dt_hours <= 0.0 || dt_hours > MAX_GAP_HOURS {
-            previous = current;
-            continue;
-        }
-        let bucket = bucket_start(current.ts, bucket_seconds);
-        if curr_now > prev_now && is_charging(previous) && is_charging(current) {
-            charge
-                .entry(bucket)
-                .or_default()
-                .record((curr_now - prev_now) / dt_hours);
-        } else if curr_now < prev_now && is_discharging(previous) && is_discharging(current) {
-            discharge
-                .entry(bucket)
-                .or_default()
-                .record((prev_now - curr_now) / dt_hours);
-        }
-        previous = current;
+        target
+            .entry(aligner.key(segment.ts))
+            .or_default()
+            .record(segment.rate_w());
     }
 
     (discharge, charge)
 }
 
 fn battery_stats_table(
-    battery_metrics: &[MetricSample],
-    power_draw: &BTreeMap<DateTime<Local>, NumberStats>,
-    discharge_rates: &BTreeMap<DateTime<Local>, NumberStats>,
-    charge_rates: &BTreeMap<DateTime<Local>, NumberStats>,
+    battery_metrics: &[&MetricSample],
+    power_draw: &BTreeMap<i64, NumberStats>,
+    discharge_rates: &BTreeMap<i64, NumberStats>,
+    charge_rates: &BTreeMap<i64, NumberStats>,
     bucket_seconds: i64,
 ) -> Table {
-    let mut buckets: BTreeMap<DateTime<Local>, Vec<&MetricSample>> = BTreeMap::new();
-    for sample in battery_metrics {
-        let bucket_key = bucket_start(sample.ts, bucket_seconds);
-        buckets.entry(bucket_key).or_default().push(sample);
-    }
+    let mut reordered = Vec::new();
+    let buckets = bucket_runs(battery_metrics, bucket_seconds, &mut reordered);
 
     let mut report = themed_table();
     report.set_header(header_cells(&[
@@ -855,45 +804,37 @@ fn battery_stats_table(
         "Latest status",
     ]));
 
-    for (bucket_start_dt, bucket_samples) in buckets {
-        let pct_values: Vec<f64> = bucket_samples
-            .iter()
-            .filter(|m| m.kind == MetricKind::BatteryPercentage)
-            .filter_map(|s| s.value)
-            .collect();
-        let (min_pct, avg_pct, max_pct) = pct_stats(&pct_values);
-        let latest_status = bucket_samples
-            .last()
-            .and_then(|s| s.details.get("status"))
-            .and_then(|v| v.as_str())
-            .unwrap_or("unknown");
+    report.add_rows(buckets.into_iter().map(|(bucket, bucket_samples)| {
+        let mut pct = NumberStats::default();
+        let mut latest_status = None;
+        for sample in bucket_samples {
+            if sample.kind == MetricKind::BatteryPercentage {
+                pct.record_opt(sample.value);
+            }
+            latest_status = sample.details.get("status");
+        }
+        let latest_status = latest_status.and_then(|v| v.as_str()).unwrap_or("unknown");
         let rates = average_rates(bucket_samples.iter().copied());
         let discharge_power = discharge_rates
-            .get(&bucket_start_dt)
+            .get(&bucket)
             .and_then(NumberStats::average)
-            .or_else(|| {
-                power_draw
-                    .get(&bucket_start_dt)
-                    .and_then(NumberStats::average)
-            })
+            .or_else(|| power_draw.get(&bucket).and_then(NumberStats::average))
             .or(rates.discharge_w);
         let charge_power = charge_rates
-            .get(&bucket_start_dt)
+            .get(&bucket)
             .and_then(NumberStats::average)
             .or(rates.charge_w);
-        report.add_row(vec![
-            Cell::new(format_bucket(bucket_start_dt, bucket_seconds))
-                .fg(Color::Magenta)
-                .add_attribute(Attribute::Bold),
+        vec![
+            window_cell(bucket, bucket_seconds),
             value_cell(bucket_samples.len()),
-            value_cell(min_pct),
-            value_cell(avg_pct),
-            value_cell(max_pct),
+            value_cell(format_percent(pct.min())),
+            value_cell(format_percent(pct.average())),
+            value_cell(format_percent(pct.max())),
             value_cell(format_power(discharge_power)),
             value_cell(format_power(charge_power)),
             status_cell(Some(latest_status)),
-        ]);
-    }
+        ]
+    }));
     report
 }
 
@@ -924,7 +865,7 @@ fn freq_usage_stats_table(
     for source in sources {
         let usage_buckets = usage.get(source);
         let freq_buckets = freq.get(source);
-        let mut keys: Vec<DateTime<Local>> = usage_buckets
+        let mut keys: Vec<i64> = usage_buckets
             .into_iter()
             .flat_map(|m| m.keys().copied())
             .chain(freq_buckets.into_iter().flat_map(|m| m.keys().copied()))
@@ -932,7 +873,7 @@ fn freq_usage_stats_table(
         keys.sort();
         keys.dedup();
 
-        for key in keys {
+        report.add_rows(keys.into_iter().map(|key| {
             let usage_stats = usage_buckets
                 .and_then(|map| map.get(&key).cloned())
                 .unwrap_or_default();
@@ -940,11 +881,9 @@ fn freq_usage_stats_table(
                 .and_then(|map| map.get(&key).cloned())
                 .unwrap_or_default();
             let samples = usage_stats.count.max(freq_stats.count);
-            report.add_row(vec![
+            vec![
                 label_cell(source),
-                Cell::new(format_bucket(key, bucket_seconds))
-                    .fg(Color::Magenta)
-                    .add_attribute(Attribute::Bold),
+                window_cell(key, bucket_seconds),
                 value_cell(samples),
                 value_cell(format_percent(usage_stats.min())),
                 value_cell(format_percent(usage_stats.average())),
@@ -952,8 +891,8 @@ fn freq_usage_stats_table(
                 value_cell(format_freq(freq_stats.min())),
                 value_cell(format_freq(freq_stats.average())),
                 value_cell(format_freq(freq_stats.max())),
-            ]);
-        }
+            ]
+        }));
     }
     report
 }
@@ -966,10 +905,7 @@ fn gpu_stats_table(bucket_seconds: i64, usage: &SourceBuckets, freq: &SourceBuck
     freq_usage_stats_table(bucket_seconds, "usage", "freq", usage, freq)
 }
 
-fn usage_stats_table(
-    bucket_seconds: i64,
-    buckets: &BTreeMap<DateTime<Local>, UsageStats>,
-) -> Table {
+fn usage_stats_table(bucket_seconds: i64, buckets: &BTreeMap<i64, UsageStats>) -> Table {
     let mut report = themed_table();
     report.set_header(header_cells(&[
         "Window",
@@ -981,30 +917,25 @@ fn usage_stats_table(
         "Peak used %",
     ]));
 
-    for (key, stats) in buckets {
-        report.add_row(vec![
-            Cell::new(format_bucket(*key, bucket_seconds))
-                .fg(Color::Magenta)
-                .add_attribute(Attribute::Bold),
+    report.add_rows(buckets.iter().map(|(key, stats)| {
+        vec![
+            window_cell(*key, bucket_seconds),
             value_cell(stats.used.count),
             value_cell(format_opt_bytes(stats.used.min())),
             value_cell(format_opt_bytes(stats.used.average())),
             value_cell(format_percent(stats.percent.min())),
             value_cell(format_percent(stats.percent.average())),
             value_cell(format_percent(stats.percent.max())),
-        ]);
-    }
+        ]
+    }));
     report
 }
 
-fn memory_stats_table(
-    bucket_seconds: i64,
-    buckets: &BTreeMap<DateTime<Local>, UsageStats>,
-) -> Table {
+fn memory_stats_table(bucket_seconds: i64, buckets: &BTreeMap<i64, UsageStats>) -> Table {
     usage_stats_table(bucket_seconds, buckets)
 }
 
-fn disk_stats_table(bucket_seconds: i64, buckets: &BTreeMap<DateTime<Local>, UsageStats>) -> Table {
+fn disk_stats_table(bucket_seconds: i64, buckets: &BTreeMap<i64, UsageStats>) -> Table {
     usage_stats_table(bucket_seconds, buckets)
 }
 
@@ -1020,53 +951,31 @@ fn temperature_stats_table(bucket_seconds: i64, buckets: &SourceBuckets) -> Tabl
     ]));
 
     for (source, readings) in buckets {
-        for (key, stats) in readings {
-            report.add_row(vec![
+        report.add_rows(readings.iter().map(|(key, stats)| {
+            vec![
                 label_cell(source),
-                Cell::new(format_bucket(*key, bucket_seconds))
-                    .fg(Color::Magenta)
-                    .add_attribute(Attribute::Bold),
+                window_cell(*key, bucket_seconds),
                 value_cell(stats.count),
-                value_cell(
-                    stats
-                        .min()
-                        .map(|v| format!("{v:.1}C"))
-                        .unwrap_or_else(|| "--".to_string()),
-                ),
-                value_cell(
-                    stats
-                        .average()
-                        .map(|v| format!("{v:.1}C"))
-                        .unwrap_or_else(|| "--".to_string()),
-                ),
-                value_cell(
-                    stats
-                        .max()
-                        .map(|v| format!("{v:.1}C"))
-                        .unwrap_or_else(|| "--".to_string()),
-                ),
-            ]);
-        }
+                value_cell(format_temp(stats.min())),
+                value_cell(format_temp(stats.average())),
+                value_cell(format_temp(stats.max())),
+            ]
+        }));
     }
     report
 }
 
-fn network_totals_table(
-    bucket_seconds: i64,
-    buckets: &BTreeMap<DateTime<Local>, TransferStats>,
-) -> Table {
+fn network_totals_table(bucket_seconds: i64, buckets: &BTreeMap<i64, TransferStats>) -> Table {
     let mut report = themed_table();
     report.set_header(header_cells(&["Window", "Total down", "Total up"]));
 
-    for (key, stats) in buckets {
-        report.add_row(vec![
-            Cell::new(format_bucket(*key, bucket_seconds))
-                .fg(Color::Magenta)
-                .add_attribute(Attribute::Bold),
+    report.add_rows(buckets.iter().map(|(key, stats)| {
+        vec![
+            window_cell(*key, bucket_seconds),
             value_cell(format_bytes(stats.rx_total)),
             value_cell(format_bytes(stats.tx_total)),
-        ]);
-    }
+        ]
+    }));
     report
 }
 
@@ -1092,40 +1001,30 @@ fn format_opt_bytes(value: Option<f64>) -> String {
     value.map(format_bytes).unwrap_or_else(|| "--".to_string())
 }
 
-fn number_from_details(sample: &MetricSample, key: &str) -> Option<f64> {
-    sample
-        .details
-        .get(key)
-        .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)))
-}
-
-fn pct_stats(values: &[f64]) -> (String, String, String) {
-    if values.is_empty() {
-        return ("--".to_string(), "--".to_string(), "--".to_string());
-    }
-    let min = values.iter().cloned().fold(f64::INFINITY, f64::min);
-    let max = values.iter().cloned().fold(f64::NEG_INFINITY, f64::max);
-    let avg = values.iter().sum::<f64>() / values.len() as f64;
-    (
-        format!("{min:.1}%"),
-        format!("{avg:.1}%"),
-        format!("{max:.1}%"),
-    )
-}
+/// Bucket labels are rendered once per table row, so the strftime patterns
+/// are parsed a single time and reused via `format_with_items`.
+fn format_bucket(key: i64, bucket_seconds: i64) -> String {
+    static MINUTE: OnceLock<Vec<Item<'static>>> = OnceLock::new();
+    static HOUR: OnceLock<Vec<Item<'static>>> = OnceLock::new();
+    static DAY: OnceLock<Vec<Item<'static>>> = OnceLock::new();
 
-fn format_bucket(dt: DateTime<Local>, bucket_seconds: i64) -> String {
-    if bucket_seconds < 3600 {
-        dt.format("%m-%d %H:%M").to_string()
+    let (items, pattern) = if bucket_seconds < 3600 {
+        (&MINUTE, "%m-%d %H:%M")
     } else if bucket_seconds < 24 * 3600 {
-        dt.format("%m-%d %H:00").to_string()
+        (&HOUR, "%m-%d %H:00")
     } else {
-        dt.format("%Y-%m-%d").to_string()
-    }
+        (&DAY, "%Y-%m-%d")
+    };
+    let items = items.get_or_init(|| StrftimeItems::new(pattern).collect());
+    bucket_datetime(key)
+        .format_with_items(items.iter())
+        .to_string()
 }
 
 #[cfg(test)]
 mod tests {
     use super::*;
+    use crate::cli_helpers::bucket_key;
     use serde_json::json;
 
     fn metric_sample_with_source(
@@ -1170,6 +1069,21 @@ mod tests {
         }
     }
 
+    #[test]
+    fn format_bucket_uses_granularity_specific_labels() {
+        let key = bucket_key(1_700_000_000.0, 300);
+        let dt = bucket_datetime(key);
+        assert_eq!(
+            format_bucket(key, 300),
+            dt.format("%m-%d %H:%M").to_string()
+        );
+        assert_eq!(
+            format_bucket(key, 3600),
+            dt.format("%m-%d %H:00").to_string()
+        );
+        assert_eq!(format_bucket(key, 86400), dt.format("%Y-%m-%d").to_string());
+    }
+
     #[test]
     fn network_rates_compute_per_second() {
         let metrics = vec![
@@ -1238,7 +1152,7 @@ mod tests {
             metric_sample_with_source(MetricKind::Temperature, "cpu0", 60.0, Some(50.0), json!({})),
         ];
 
-        let buckets = bucket_stats_for_kind_by_source(&metrics, MetricKind::Temperature, 60);
+        let buckets = bucket_stats_by_source(&metrics, 60);
         assert_eq!(buckets.len(), 2);
         let cpu0_count: usize = buckets
             .get("cpu0")
@@ -1256,6 +1170,26 @@ mod tests {
         assert_eq!(cpu1_count, 1);
     }
 
+    #[test]
+    fn samples_by_kind_keeps_battery_rows_together() {
+        let metrics = vec![
+            battery_metric(0.0, MetricKind::BatteryPercentage, 80.0, "Discharging"),
+            metric_sample(MetricKind::CpuUsage, 0.0, Some(10.0), json!({})),
+            battery_metric(0.0, MetricKind::BatteryEnergyNow, 40.0, "Discharging"),
+            metric_sample(MetricKind::CpuUsage, 5.0, Some(20.0), json!({})),
+        ];
+
+        let samples = SamplesByKind::new(&metrics);
+
+        assert_eq!(samples.battery.len(), 2);
+        assert_eq!(samples.of(MetricKind::CpuUsage).count(), 2);
+        assert_eq!(samples.of(MetricKind::MemoryUsage).count(), 0);
+        assert_eq!(
+            average_value(samples.of(MetricKind::CpuUsage)).average(),
+            Some(15.0)
+        );
+    }
+
     #[test]
     fn metrics_can_be_filtered_by_source() {
         let metrics = vec![
@@ -1263,7 +1197,7 @@ mod tests {
             metric_sample_with_source(MetricKind::CpuUsage, "cpu1", 0.0, Some(20.0), json!({})),
         ];
 
-        let filtered = filter_metrics_by_source(&metrics, &["cpu1".to_string()]);
+        let filtered = filter_metrics_by_source(metrics, &["cpu1".to_string()]);
         assert_eq!(filtered.len(), 1);
         assert_eq!(filtered[0].source, "cpu1");
     }
@@ -1291,11 +1225,11 @@ mod tests {
             battery_metric(600.0, MetricKind::BatteryEnergyNow, 12.5, "Charging"),
         ];
 
-        let (discharge, charge) = battery_rate_buckets(&metrics, 300);
+        let (discharge, charge) = battery_rate_buckets(&rate_segments(&metrics), 300);
 
         assert!(discharge.is_empty());
-        let first_bucket = bucket_start(metrics[1].ts, 300);
-        let second_bucket = bucket_start(metrics[2].ts, 300);
+        let first_bucket = bucket_key(metrics[1].ts, 300);
+        let second_bucket = bucket_key(metrics[2].ts, 300);
         let first_rate = charge
             .get(&first_bucket)
             .and_then(NumberStats::average)
@@ -1318,10 +1252,10 @@ mod tests {
             battery_metric(900.0, MetricKind::BatteryEnergyNow, 50.5, "Charging"),
         ];
 
-        let (discharge, charge) = battery_rate_buckets(&metrics, 600);
+        let (discharge, charge) = battery_rate_buckets(&rate_segments(&metrics), 600);
 
-        let discharge_bucket = bucket_start(metrics[1].ts, 600);
-        let charge_bucket = bucket_start(metrics[3].ts, 600);
+        let discharge_bucket = bucket_key(metrics[1].ts, 600);
+        let charge_bucket = bucket_key(metrics[3].ts, 600);
         assert!(discharge.contains_key(&discharge_bucket));
         assert!(charge.contains_key(&charge_bucket));
     }
@@ -1,4 +1,5 @@
 use std::borrow::Cow;
+use std::collections::HashMap;
 use std::path::{Path, PathBuf};
 
 use chrono::{DateTime, Local, TimeZone, Utc};
@@ -55,6 +56,24 @@ pub fn default_graph_path(
         .join(filename)
 }
 
+/// Span (max−min ts) of the provided samples, used to choose a bucket width
+/// shared by the printed report tables and the plots.
+pub fn data_span_seconds(metrics: &[MetricSample]) -> Option<f64> {
+    let mut min_ts = f64::INFINITY;
+    let mut max_ts = f64::NEG_INFINITY;
+
+    for ts in metrics.iter().map(|s| s.ts) {
+        min_ts = min_ts.min(ts);
+        max_ts = max_ts.max(ts);
+    }
+
+    if max_ts.is_finite() && min_ts.is_finite() && max_ts >= min_ts {
+        Some(max_ts - min_ts)
+    } else {
+        None
+    }
+}
+
 pub fn bucket_span_seconds(timeframe: &Timeframe, data_span_seconds: Option<f64>) -> i64 {
     // Note: tightened at the short end of the table so 5-minute-collected
     // data produces dense polygon lines even on `--days 1`/`--hours 6` charts
@@ -76,43 +95,161 @@ pub fn bucket_span_seconds(timeframe: &Timeframe, data_span_seconds: Option<f64>
     }
 }
 
-/// Aligns an epoch-seconds timestamp to a bucket boundary in local time.
+/// Epoch seconds of the local-time bucket boundary containing `ts`. Report
+/// tables and charts group on this integer key and only convert each distinct
+/// bucket to a `DateTime` (via [`bucket_datetime`]) for its label.
 ///
 /// DST-safe: samples that fall in a spring-forward gap (`None` from
 /// `timestamp_opt`) are aligned using a UTC snapshot of the offset bracketing
 /// the gap, so we never panic. DST folds pick the earlier of the two
 /// ambiguous local times for consistent bucketing.
-pub fn bucket_start(ts: f64, bucket_seconds: i64) -> DateTime<Local> {
-    local_bucket_start(ts as i64, bucket_seconds, 0)
+pub fn bucket_key(ts: f64, bucket_seconds: i64) -> i64 {
+    let ts_secs = ts as i64;
+    let offset_seconds = local_offset_seconds(ts_secs);
+    let local_secs = ts_secs + offset_seconds;
+    let bucket_epoch = local_secs.div_euclid(bucket_seconds) * bucket_seconds - offset_seconds;
+    bucket_epoch.max(0)
 }
 
-fn local_bucket_start(ts_secs: i64, bucket_seconds: i64, nanos: u32) -> DateTime<Local> {
-    let local_dt = match Local.timestamp_opt(ts_secs, nanos).earliest() {
+/// Local `DateTime` for a key produced by [`bucket_key`].
+pub fn bucket_datetime(key: i64) -> DateTime<Local> {
+    match Local.timestamp_opt(key, 0).earliest() {
+        Some(dt) => dt,
+        None => DateTime::<Local>::from(
+            Utc.timestamp_opt(key, 0)
+                .single()
+                .expect("aligned epoch is always representable as UTC"),
+        ),
+    }
+}
+
+/// Memoizing [`bucket_key`] for mostly ordered sample streams.
+///
+/// Consecutive samples usually land in the same bucket, so the aligner keeps
+/// the epoch range of the last bucket and answers hits with two integer
+/// comparisons instead of a local-offset lookup. A bucket is only cached when
+/// the UTC offset is the same at both of its ends; buckets straddling a DST
+/// change always go through [`bucket_key`].
+pub struct BucketAligner {
+    bucket_seconds: i64,
+    cached: Option<(i64, i64)>,
+}
+
+impl BucketAligner {
+    pub fn new(bucket_seconds: i64) -> Self {
+        Self {
+            bucket_seconds,
+            cached: None,
+        }
+    }
+
+    pub fn key(&mut self, ts: f64) -> i64 {
+        let ts_secs = ts as i64;
+        if let Some((start, end)) = self.cached {
+            if (start..end).contains(&ts_secs) {
+                return start;
+            }
+        }
+        let key = bucket_key(ts, self.bucket_seconds);
+        let end = key + self.bucket_seconds;
+        self.cached = (key > 0
+            && (key..end).contains(&ts_secs)
+            && local_offset_seconds(key) == local_offset_seconds(end - 1))
+        .then_some((key, end));
+        key
+    }
+}
+
+/// Samples split by kind in one pass, so the report tables and the charts
+/// each walk only their own rows instead of re-filtering the whole window.
+/// Battery kinds are additionally collected into `battery`, still in ts
+/// order, because the battery tables read them as one interleaved stream.
+pub struct SamplesByKind<'a> {
+    by_kind: HashMap<MetricKind, Vec<&'a MetricSample>>,
+    pub battery: Vec<&'a MetricSample>,
+}
+
+impl<'a> SamplesByKind<'a> {
+    pub fn new(metrics: &'a [MetricSample]) -> Self {
+        let mut by_kind: HashMap<MetricKind, Vec<&MetricSample>> = HashMap::new();
+        let mut battery = Vec::new();
+        for sample in metrics {
+            if matches!(
+                sample.kind,
+                MetricKind::BatteryPercentage
+                    | MetricKind::BatteryCapacity
+                    | MetricKind::BatteryHealth
+                    | MetricKind::BatteryEnergyNow
+                    | MetricKind::BatteryEnergyFull
+                    | MetricKind::BatteryEnergyFullDesign
+            ) {
+                battery.push(sample);
+            }
+            by_kind.entry(sample.kind.clone()).or_default().push(sample);
+        }
+        Self { by_kind, battery }
+    }
+
+    pub fn of(&self, kind: MetricKind) -> impl Iterator<Item = &'a MetricSample> + '_ {
+        self.by_kind.get(&kind).into_iter().flatten().copied()
+    }
+}
+
+/// Splits ts-ordered samples into `(bucket key, samples)` runs without copying.
+///
+/// Samples come back from SQL sorted by `ts`, so every bucket is normally one
+/// contiguous run. A DST fold can map a later sample to an earlier key; in
+/// that case the samples are stably re-sorted by key so each bucket still
+/// yields exactly one run, in key order.
+pub fn bucket_runs<'s, 'a>(
+    samples: &'s [&'a MetricSample],
+    bucket_seconds: i64,
+    reordered: &'s mut Vec<&'a MetricSample>,
+) -> Vec<(i64, &'s [&'a MetricSample])> {
+    let mut aligner = BucketAligner::new(bucket_seconds);
+    let keys: Vec<i64> = samples.iter().map(|s| aligner.key(s.ts)).collect();
+    if keys.windows(2).all(|w| w[0] <= w[1]) {
+        return split_runs(samples, &keys);
+    }
+
+    let mut keyed: Vec<(i64, &'a MetricSample)> =
+        keys.into_iter().zip(samples.iter().copied()).collect();
+    keyed.sort_by_key(|(key, _)| *key);
+    let keys: Vec<i64> = keyed.iter().map(|(key, _)| *key).collect();
+    *reordered = keyed.into_iter().map(|(_, sample)| sample).collect();
+    split_runs(reordered, &keys)
+}
+
+fn split_runs<'s, 'a>(
+    samples: &'s [&'a MetricSample],
+    keys: &[i64],
+) -> Vec<(i64, &'s [&'a MetricSample])> {
+    let mut runs = Vec::new();
+    let mut start = 0;
+    for end in 1..=samples.len() {
+        if end == samples.len() || keys[end] != keys[start] {
+            runs.push((keys[start], &samples[start..end]));
+            start = end;
+        }
+    }
+    runs
+}
+
+fn local_offset_seconds(ts_secs: i64) -> i64 {
+    let local_dt = match Local.timestamp_opt(ts_secs, 0).earliest() {
         Some(dt) => dt,
         None => {
             // Spring-forward gap (or missing tzdata). Fall back to UTC-as-local:
             // the wall-clock label may be off by up to an hour, but the instant
             // stays correct and bucket alignment degrades gracefully.
             let utc = Utc
-                .timestamp_opt(ts_secs, nanos)
+                .timestamp_opt(ts_secs, 0)
                 .single()
                 .expect("epoch seconds are always representable as UTC");
             DateTime::<Local>::from(utc)
         }
     };
-    let offset_seconds = -local_dt.offset().utc_minus_local();
-    let bucket_epoch = (((ts_secs as f64 + offset_seconds as f64) / bucket_seconds as f64).floor()
-        * bucket_seconds as f64)
-        - offset_seconds as f64;
-    let aligned = bucket_epoch.max(0.0) as i64;
-    match Local.timestamp_opt(aligned, 0).earliest() {
-        Some(dt) => dt,
-        None => DateTime::<Local>::from(
-            Utc.timestamp_opt(aligned, 0)
-                .single()
-                .expect("aligned epoch is always representable as UTC"),
-        ),
-    }
+    -i64::from(local_dt.offset().utc_minus_local())
 }
 
 #[derive(Debug, Default, PartialEq)]
@@ -142,38 +279,68 @@ impl RateAccumulator {
     }
 }
 
-pub fn average_rates<'a>(
-    battery_metrics: impl IntoIterator<Item = &'a MetricSample>,
-) -> AverageRates {
-    let mut discharge = RateAccumulator::default();
-    let mut charge = RateAccumulator::default();
+/// One pair of consecutive `BatteryEnergyNow` readings that counts as a
+/// charge or discharge segment: both ends agree on the direction, the energy
+/// moved that way, and the readings are at most [`MAX_GAP_HOURS`] apart.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub struct RateSegment {
+    /// Timestamp of the later reading; rate buckets are keyed on it.
+    pub ts: f64,
+    /// Energy moved over the segment in Wh, always positive.
+    pub delta_wh: f64,
+    pub dt_hours: f64,
+    pub charging: bool,
+}
+
+impl RateSegment {
+    pub fn rate_w(&self) -> f64 {
+        self.delta_wh / self.dt_hours
+    }
+}
 
-    let energy_now_samples: Vec<_> = battery_metrics
+/// Collects the qualifying charge/discharge segments of `battery_metrics` in
+/// one pass, so overall averages and per-bucket rates can share a single walk
+/// over the readings.
+pub fn rate_segments<'a>(
+    battery_metrics: impl IntoIterator<Item = &'a MetricSample>,
+) -> Vec<RateSegment> {
+    let mut previous: Option<(&MetricSample, ChargeState)> = None;
+    battery_metrics
         .into_iter()
         .filter(|m| m.kind == MetricKind::BatteryEnergyNow && m.value.is_some())
-        .collect();
-
-    let mut iter = energy_now_samples.iter();
-    let mut previous = match iter.next() {
-        Some(sample) => sample,
-        None => return AverageRates::default(),
-    };
-
-    for current in iter {
-        if current.ts < previous.ts {
-            previous = current;
-            continue;
-        }
-        let dt_hours = (current.ts - previous.ts) / 3600.0;
-        if dt_hours > 0.0 && dt_hours <= MAX_GAP_HOURS {
-            let delta = current.value.unwrap() - previous.value.unwrap();
-            if delta > 0.0 && is_charging(previous) && is_charging(current) {
-                charge.record(delta, dt_hours);
-            } else if delta < 0.0 && is_discharging(previous) && is_discharging(current) {
-                discharge.record(-delta, dt_hours);
+        .filter_map(|current| {
+            let state = ChargeState::of(current);
+            let (previous, previous_state) = previous.replace((current, state))?;
+            let dt_hours = (current.ts - previous.ts) / 3600.0;
+            if dt_hours <= 0.0 || dt_hours > MAX_GAP_HOURS || state != previous_state {
+                return None;
             }
-        }
-        previous = current;
+            let delta = current.value? - previous.value?;
+            let charging = match state {
+                ChargeState::Charging if delta > 0.0 => true,
+                ChargeState::Discharging if delta < 0.0 => false,
+                _ => return None,
+            };
+            Some(RateSegment {
+                ts: current.ts,
+                delta_wh: delta.abs(),
+                dt_hours,
+                charging,
+            })
+        })
+        .collect()
+}
+
+pub fn average_rates_from_segments(segments: &[RateSegment]) -> AverageRates {
+    let mut discharge = RateAccumulator::default();
+    let mut charge = RateAccumulator::default();
+    for segment in segments {
+        let accumulator = if segment.charging {
+            &mut charge
+        } else {
+            &mut discharge
+        };
+        accumulator.record(segment.delta_wh, segment.dt_hours);
     }
 
     AverageRates {
@@ -182,22 +349,32 @@ pub fn average_rates<'a>(
     }
 }
 
-pub(crate) fn is_discharging(sample: &MetricSample) -> bool {
-    sample
-        .details
-        .get("status")
-        .and_then(|v| v.as_str())
-        .map(|s| s.eq_ignore_ascii_case("discharging"))
-        .unwrap_or(true)
+pub fn average_rates<'a>(
+    battery_metrics: impl IntoIterator<Item = &'a MetricSample>,
+) -> AverageRates {
+    average_rates_from_segments(&rate_segments(battery_metrics))
 }
 
-pub(crate) fn is_charging(sample: &MetricSample) -> bool {
-    sample
-        .details
-        .get("status")
-        .and_then(|v| v.as_str())
-        .map(|s| s.eq_ignore_ascii_case("charging"))
-        .unwrap_or(false)
+/// Direction reported by a reading's `status` detail, resolved once per
+/// reading so the segment walk compares enum tags instead of re-reading and
+/// case-folding the status string for both ends of every pair. A reading
+/// without a status counts as discharging.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+enum ChargeState {
+    Charging,
+    Discharging,
+    Other,
+}
+
+impl ChargeState {
+    fn of(sample: &MetricSample) -> Self {
+        match sample.details.get("status").and_then(|v| v.as_str()) {
+            None => ChargeState::Discharging,
+            Some(s) if s.eq_ignore_ascii_case("charging") => ChargeState::Charging,
+            Some(s) if s.eq_ignore_ascii_case("discharging") => ChargeState::Discharging,
+            Some(_) => ChargeState::Other,
+        }
+    }
 }
 
 #[allow(dead_code)]
@@ -210,23 +387,28 @@ pub fn average_charge_w(battery_metrics: &[MetricSample]) -> Option<f64> {
     average_rates(battery_metrics).charge_w
 }
 
-pub fn estimate_runtime_hours(
+pub fn estimate_runtime_hours<'a>(
     avg_discharge_w: Option<f64>,
-    battery_metrics: &[MetricSample],
+    battery_metrics: impl IntoIterator<Item = &'a MetricSample>,
 ) -> Option<f64> {
     let avg = avg_discharge_w?;
     if avg <= 0.0 {
         return None;
     }
-    let capacity_wh = battery_metrics
-        .iter()
-        .find(|m| m.kind == MetricKind::BatteryEnergyFull && m.value.is_some())
-        .or_else(|| {
-            battery_metrics
-                .iter()
-                .find(|m| m.kind == MetricKind::BatteryEnergyFullDesign && m.value.is_some())
-        })
-        .and_then(|m| m.value)?;
+    // Prefer the first full-charge reading, falling back to the design capacity.
+    let mut design_wh = None;
+    let mut full_wh = None;
+    for m in battery_metrics {
+        match m.kind {
+            MetricKind::BatteryEnergyFull if m.value.is_some() => {
+                full_wh = m.value;
+                break;
+            }
+            MetricKind::BatteryEnergyFullDesign if design_wh.is_none() => design_wh = m.value,
+            _ => {}
+        }
+    }
+    let capacity_wh = full_wh.or(design_wh)?;
     if capacity_wh <= 0.0 {
         return None;
     }
@@ -246,6 +428,22 @@ pub fn format_runtime(hours: Option<f64>) -> String {
     }
 }
 
+/// Increase of a monotonically growing counter; resets (and missing values)
+/// count as zero rather than a negative transfer.
+pub fn counter_delta(previous: Option<f64>, current: Option<f64>) -> f64 {
+    match (previous, current) {
+        (Some(prev), Some(next)) if next >= prev => next - prev,
+        _ => 0.0,
+    }
+}
+
+pub fn detail_number(sample: &MetricSample, key: &str) -> Option<f64> {
+    sample
+        .details
+        .get(key)
+        .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)))
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -297,6 +495,17 @@ mod tests {
         assert_eq!(format_runtime(Some(runtime_hours)), "12h30m");
     }
 
+    #[test]
+    fn runtime_estimate_falls_back_to_design_capacity() {
+        let metrics = vec![
+            battery_metric(0.0, MetricKind::BatteryEnergyFullDesign, 70.0, None),
+            battery_metric(300.0, MetricKind::BatteryEnergyFullDesign, 80.0, None),
+        ];
+        let runtime_hours = estimate_runtime_hours(Some(7.0), &metrics).unwrap();
+        assert!((runtime_hours - 10.0).abs() < 0.01);
+        assert_eq!(estimate_runtime_hours(Some(7.0), &metrics[..0]), None);
+    }
+
     #[test]
     fn average_discharge_ignores_large_gaps() {
         let metrics = vec![
@@ -392,7 +601,7 @@ mod tests {
             .unwrap()
             .with_nanosecond(0)
             .unwrap();
-        let bucket = bucket_start(sample_dt.timestamp() as f64, span);
+        let bucket = bucket_datetime(bucket_key(sample_dt.timestamp() as f64, span));
 
         assert_eq!(span, 5 * 60);
         assert_eq!(bucket.minute() % 5, 0);
@@ -400,12 +609,80 @@ mod tests {
 
         let one_day = build_timeframe(0, 1, 0, false).unwrap();
         let span_day = bucket_span_seconds(&one_day, None);
-        let bucket_day = bucket_start(sample_dt.timestamp() as f64, span_day);
+        let bucket_day = bucket_datetime(bucket_key(sample_dt.timestamp() as f64, span_day));
         assert_eq!(span_day, 15 * 60);
         assert_eq!(bucket_day.minute() % 15, 0);
         assert_eq!(bucket_day.second(), 0);
     }
 
+    #[test]
+    fn bucket_key_round_trips_through_bucket_datetime() {
+        let ts = 1_700_000_123.0;
+        for span in [5 * 60, 15 * 60, 3600, 24 * 3600] {
+            let key = bucket_key(ts, span);
+            assert_eq!(bucket_datetime(key).timestamp(), key);
+            assert!(key as f64 <= ts && ts < (key + span) as f64);
+        }
+    }
+
+    #[test]
+    fn bucket_aligner_matches_bucket_key() {
+        let mut aligner = BucketAligner::new(900);
+        let base = 1_700_000_000.0;
+        for ts in [
+            0.0,
+            30.0,
+            899.0,
+            900.0,
+            1800.5,
+            450.0,
+            7200.0,
+            3600.0 * 24.0,
+        ] {
+            assert_eq!(aligner.key(base + ts), bucket_key(base + ts, 900));
+        }
+    }
+
+    #[test]
+    fn charge_state_treats_missing_status_as_discharging() {
+        let state = |status| {
+            ChargeState::of(&battery_metric(
+                0.0,
+                MetricKind::BatteryEnergyNow,
+                1.0,
+                status,
+            ))
+        };
+        assert_eq!(state(None), ChargeState::Discharging);
+        assert_eq!(state(Some("CHARGING")), ChargeState::Charging);
+        assert_eq!(state(Some("Discharging")), ChargeState::Discharging);
+        assert_eq!(state(Some("Full")), ChargeState::Other);
+    }
+
+    #[test]
+    fn bucket_runs_group_contiguous_samples() {
+        let base = 1_700_000_000.0;
+        let metrics: Vec<MetricSample> = [0.0, 10.0, 900.0, 950.0, 2000.0]
+            .into_iter()
+            .map(|ts| battery_metric(base + ts, MetricKind::BatteryPercentage, 50.0, None))
+            .collect();
+        let refs: Vec<&MetricSample> = metrics.iter().collect();
+
+        let mut reordered = Vec::new();
+        let runs = bucket_runs(&refs, 900, &mut reordered);
+
+        assert!(runs.windows(2).all(|w| w[0].0 < w[1].0));
+        let total: usize = runs
+            .iter()
+            .map(|(key, run)| {
+                assert!(run.iter().all(|s| bucket_key(s.ts, 900) == *key));
+                run.len()
+            })
+            .sum();
+        assert_eq!(total, metrics.len());
+        assert!(reordered.is_empty());
+    }
+
     #[test]
     fn short_timeframes_use_five_minute_buckets() {
         use crate::timeframe::build_timeframe;
@@ -418,7 +695,7 @@ mod tests {
             .unwrap()
             .with_nanosecond(0)
             .unwrap();
-        let bucket = bucket_start(sample_dt.timestamp() as f64, span);
+        let bucket = bucket_datetime(bucket_key(sample_dt.timestamp() as f64, span));
 
         assert_eq!(span, 5 * 60);
         assert_eq!(bucket.minute() % 5, 0);
@@ -435,4 +712,21 @@ mod tests {
         let weekly = bucket_span_seconds(&timeframe, Some(200.0 * 24.0 * 3600.0));
         assert_eq!(weekly, 7 * 24 * 3600);
     }
+    #[test]
+    fn data_span_covers_unsorted_samples() {
+        let metrics = vec![
+            battery_metric(600.0, MetricKind::BatteryEnergyNow, 1.0, None),
+            battery_metric(0.0, MetricKind::BatteryEnergyNow, 1.0, None),
+            battery_metric(300.0, MetricKind::BatteryEnergyNow, 1.0, None),
+        ];
+        assert_eq!(data_span_seconds(&metrics), Some(600.0));
+        assert_eq!(data_span_seconds(&[]), None);
+    }
+
+    #[test]
+    fn counter_delta_treats_resets_as_zero() {
+        assert_eq!(counter_delta(Some(100.0), Some(150.0)), 50.0);
+        assert_eq!(counter_delta(Some(150.0), Some(10.0)), 0.0);
+        assert_eq!(counter_delta(None, Some(10.0)), 0.0);
+    }
 }
@@ -1,9 +1,10 @@
 use std::path::{Path, PathBuf};
-use std::thread;
+use std::sync::atomic::{AtomicBool, Ordering};
 use std::time::{Duration, SystemTime, UNIX_EPOCH};
 
 use anyhow::Result;
 use log::{info, warn};
+use rusqlite::Connection;
 
 use crate::db;
 use crate::metrics::{self, MetricSample};
@@ -39,17 +40,109 @@ pub fn collect_once(
 ) -> Result<i32> {
     let resolved_db = resolve_db_path(db_path);
     let mut conn = db::init_db_connection(&resolved_db)?;
+    collect_once_with_conn(&mut conn, sysfs_root, prune_days)
+}
+
+/// [`collect_loop`] refreshes planner statistics on its first write and then
+/// once every this many writes.
+const OPTIMIZE_EVERY_FLUSHES: u32 = 100;
+/// Consecutive failed writes [`collect_loop`] tolerates, keeping the buffer
+/// and retrying on the next tick, before it gives up.
+const MAX_FLUSH_FAILURES: u32 = 5;
+/// Samples [`collect_loop`] keeps in memory before writing them in one transaction.
+const FLUSH_MAX_SAMPLES: usize = 1024;
+/// Longest a sample waits in [`collect_loop`]'s buffer, measured on the wall
+/// clock so time spent suspended counts towards it.
+const FLUSH_INTERVAL: Duration = Duration::from_secs(300);
+
+static STOP_REQUESTED: AtomicBool = AtomicBool::new(false);
+
+extern "C" fn request_stop(_signal: libc::c_int) {
+    STOP_REQUESTED.store(true, Ordering::SeqCst);
+}
+
+/// Route the first SIGINT/SIGTERM to a flag so [`collect_loop`] can flush its
+/// buffer before exiting. `SA_RESETHAND` restores the default action after
+/// that, so a second signal still kills a loop stuck in a hung sysfs read.
+/// `SA_RESTART` is left off so the signal cuts [`sleep_unless_stopped`] short.
+fn install_stop_handlers() {
+    unsafe {
+        let mut action: libc::sigaction = std::mem::zeroed();
+        action.sa_sigaction = request_stop as extern "C" fn(libc::c_int) as libc::sighandler_t;
+        action.sa_flags = libc::SA_RESETHAND;
+        libc::sigemptyset(&mut action.sa_mask);
+        libc::sigaction(libc::SIGINT, &action, std::ptr::null_mut());
+        libc::sigaction(libc::SIGTERM, &action, std::ptr::null_mut());
+    }
+}
+
+fn stop_requested() -> bool {
+    STOP_REQUESTED.load(Ordering::SeqCst)
+}
+
+/// Sleep for `duration` in a single `nanosleep`, which returns early with
+/// EINTR when a stop signal is handled. Interruptions that did not request a
+/// stop resume with the time left.
+fn sleep_unless_stopped(duration: Duration) {
+    let mut request = libc::timespec {
+        tv_sec: duration.as_secs() as _,
+        tv_nsec: duration.subsec_nanos() as _,
+    };
+    let mut remaining = libc::timespec {
+        tv_sec: 0,
+        tv_nsec: 0,
+    };
+    while !stop_requested() && unsafe { libc::nanosleep(&request, &mut remaining) } == -1 {
+        request = remaining;
+    }
+}
+
+/// Whether the buffer must be written now: it is full, or holding it for one
+/// more `interval` would keep its oldest sample unwritten for
+/// [`FLUSH_INTERVAL`] or longer. Intervals of [`FLUSH_INTERVAL`] or more
+/// therefore write every tick.
+fn flush_due(buffered: usize, oldest_age: Duration, interval: Duration) -> bool {
+    buffered > 0 && (buffered >= FLUSH_MAX_SAMPLES || oldest_age + interval >= FLUSH_INTERVAL)
+}
+
+fn now_secs() -> f64 {
+    SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .unwrap_or_default()
+        .as_secs_f64()
+}
+
+/// One collection tick against an already-initialized connection, so
+/// [`collect_loop`] opens the database and runs the schema setup only once.
+fn collect_once_with_conn(
+    conn: &mut Connection,
+    sysfs_root: Option<&Path>,
+    prune_days: Option<u64>,
+) -> Result<i32> {
+    let (metric_samples, battery_count) = sample_system(sysfs_root);
+    store_samples(conn, &metric_samples, prune_days)?;
+    refresh_planner_stats(conn);
 
+    if !metric_samples.is_empty() {
+        info!(
+            "Logged {} metric records ({} batteries)",
+            metric_samples.len(),
+            battery_count
+        );
+    }
+    Ok(0)
+}
+
+/// Read every battery and system metric for the current instant. Returns the
+/// samples along with the number of batteries that produced readings.
+fn sample_system(sysfs_root: Option<&Path>) -> (Vec<MetricSample>, usize) {
     let root = sysfs_root.unwrap_or_else(|| Path::new("/sys/class/power_supply"));
     let battery_paths = find_battery_paths(root);
     if battery_paths.is_empty() {
         warn!("No batteries found in sysfs; collecting other metrics only");
     }
 
-    let ts = SystemTime::now()
-        .duration_since(UNIX_EPOCH)
-        .unwrap_or_default()
-        .as_secs_f64();
+    let ts = now_secs();
 
     let mut metric_samples: Vec<MetricSample> = Vec::new();
     let mut battery_count = 0;
@@ -58,13 +151,9 @@ pub fn collect_once(
         let battery_metrics = create_battery_metrics(&reading, ts);
         if !battery_metrics.is_empty() {
             battery_count += 1;
-            let source_name = path
-                .file_name()
-                .map(|p| p.to_string_lossy())
-                .unwrap_or_else(|| path.to_string_lossy());
             info!(
                 "Logged record for {}: percent={:.2} health={:.2}",
-                source_name,
+                reading.name,
                 reading.percentage.unwrap_or(0.0),
                 reading.health_pct.unwrap_or(0.0)
             );
@@ -73,13 +162,22 @@ pub fn collect_once(
     }
 
     metric_samples.extend(metrics::collect_metrics(ts));
-    db::insert_metric_samples_with_conn(&mut conn, &metric_samples)?;
+    (metric_samples, battery_count)
+}
 
-    // Retention: prune samples older than `prune_days` days, once per tick.
+/// Write samples in one transaction, then run retention.
+fn store_samples(
+    conn: &mut Connection,
+    metric_samples: &[MetricSample],
+    prune_days: Option<u64>,
+) -> Result<()> {
+    db::insert_metric_samples_with_conn(conn, metric_samples)?;
+
+    // Retention: prune samples older than `prune_days` days, once per write.
     // Cheap relative to the collection itself (a single DELETE indexed by ts).
     if let Some(days) = prune_days {
         if days > 0 {
-            match db::prune_older_than_days_with_conn(&conn, days) {
+            match db::prune_older_than_days_with_conn(conn, days) {
                 Ok(removed) if removed > 0 => {
                     info!("Pruned {removed} samples older than {days} days")
                 }
@@ -88,29 +186,87 @@ pub fn collect_once(
             }
         }
     }
+    Ok(())
+}
 
-    if !metric_samples.is_empty() {
-        info!(
-            "Logged {} metric records ({} batteries)",
-            metric_samples.len(),
-            battery_count
-        );
+/// Planner upkeep is best effort: a failure never costs collected samples.
+fn refresh_planner_stats(conn: &Connection) {
+    if let Err(e) = db::optimize_with_conn(conn) {
+        warn!("Updating query planner statistics failed: {e}");
     }
-    Ok(0)
 }
 
+fn flush_buffer(
+    conn: &mut Connection,
+    buffer: &mut Vec<MetricSample>,
+    prune_days: Option<u64>,
+) -> Result<()> {
+    if buffer.is_empty() {
+        return Ok(());
+    }
+    store_samples(conn, buffer, prune_days)?;
+    info!("Logged {} buffered metric records", buffer.len());
+    buffer.clear();
+    Ok(())
+}
+
+/// Collect every `interval_seconds`, buffering samples and writing them in
+/// one transaction once [`flush_due`] says so. The first tick is written
+/// straight away; after that, samples can reach the database (and `report`)
+/// up to [`FLUSH_INTERVAL`] late. A failed write keeps the buffer and is
+/// retried on the next tick; the loop only returns the error after
+/// [`MAX_FLUSH_FAILURES`] failures in a row. SIGINT/SIGTERM flush the buffer
+/// and return.
 pub fn collect_loop(
     interval_seconds: u64,
     db_path: Option<&Path>,
     sysfs_root: Option<&Path>,
     prune_days: Option<u64>,
 ) -> Result<()> {
+    let resolved_db = resolve_db_path(db_path);
+    let mut conn = db::init_db_connection(&resolved_db)?;
+    install_stop_handlers();
+
+    let interval = Duration::from_secs(interval_seconds);
+    let mut buffer: Vec<MetricSample> = Vec::new();
+    let mut first_tick = true;
+    let mut flushes: u32 = 0;
+    let mut failures: u32 = 0;
     loop {
-        let exit_code = collect_once(db_path, sysfs_root, prune_days)?;
-        if exit_code != 0 {
-            warn!("Collection returned exit code {exit_code}");
+        buffer.extend(sample_system(sysfs_root).0);
+        let oldest_age = buffer
+            .first()
+            .map(|sample| Duration::from_secs_f64((now_secs() - sample.ts).max(0.0)))
+            .unwrap_or_default();
+        if first_tick || failures > 0 || flush_due(buffer.len(), oldest_age, interval) {
+            match flush_buffer(&mut conn, &mut buffer, prune_days) {
+                Ok(()) => {
+                    failures = 0;
+                    if flushes % OPTIMIZE_EVERY_FLUSHES == 0 {
+                        refresh_planner_stats(&conn);
+                    }
+                    flushes = flushes.wrapping_add(1);
+                }
+                Err(e) => {
+                    failures += 1;
+                    if failures >= MAX_FLUSH_FAILURES {
+                        return Err(e);
+                    }
+                    warn!(
+                        "Writing {} buffered samples failed ({failures}/{MAX_FLUSH_FAILURES}); \
+                         retrying next tick: {e}",
+                        buffer.len()
+                    );
+                }
+            }
+            first_tick = false;
+        }
+
+        sleep_unless_stopped(interval);
+        if stop_requested() {
+            info!("Stopping collection; writing buffered samples");
+            return flush_buffer(&mut conn, &mut buffer, prune_days);
         }
-        thread::sleep(Duration::from_secs(interval_seconds));
     }
 }
 
@@ -149,6 +305,20 @@ mod tests {
         }
     }
 
+    #[test]
+    fn flush_due_on_sample_count_or_age() {
+        let short = Duration::from_secs(30);
+        assert!(!flush_due(0, Duration::ZERO, short));
+        assert!(!flush_due(FLUSH_MAX_SAMPLES - 1, Duration::ZERO, short));
+        assert!(flush_due(FLUSH_MAX_SAMPLES, Duration::ZERO, short));
+        // Another 30 s wait would leave the oldest sample unwritten too long.
+        let almost = FLUSH_INTERVAL - short - Duration::from_secs(1);
+        assert!(!flush_due(1, almost, short));
+        assert!(flush_due(1, FLUSH_INTERVAL - short, short));
+        // Long intervals write every tick.
+        assert!(flush_due(1, Duration::ZERO, FLUSH_INTERVAL));
+    }
+
     #[test]
     fn resolve_db_path_prefers_argument() {
         let _lock = env_lock().lock().unwrap();
@@ -4,7 +4,8 @@ use std::str::FromStr;
 use std::time::Duration;
 
 use anyhow::Result;
-use rusqlite::{params, Connection, Row};
+use rusqlite::types::ValueRef;
+use rusqlite::{params, Connection, Row, TransactionBehavior};
 
 use crate::metrics::{MetricKind, MetricSample};
 
@@ -79,9 +80,14 @@ pub fn insert_metric_samples_with_conn(
     if samples.is_empty() {
         return Ok(());
     }
-    let tx = conn.transaction()?;
+    // IMMEDIATE takes the write lock at BEGIN, where `busy_timeout` can wait it
+    // out, rather than upgrading mid-batch and failing with SQLITE_BUSY when
+    // another writer got there first.
+    let tx = conn.transaction_with_behavior(TransactionBehavior::Immediate)?;
     {
-        let mut stmt = tx.prepare(
+        // Cached on the connection: a long-lived collector connection compiles
+        // the INSERT once instead of on every tick.
+        let mut stmt = tx.prepare_cached(
             r#"
             INSERT INTO metric_samples (
                 ts, kind, source, value, unit, details
@@ -116,7 +122,7 @@ pub fn count_metric_samples(db_path: &Path, since_ts: Option<f64>) -> Result<usi
 }
 
 pub fn count_metric_samples_with_conn(conn: &Connection, since_ts: Option<f64>) -> Result<usize> {
-    let count: i64 = match since_ts {
+    let count: i64 = match effective_since(since_ts) {
         Some(ts) => conn.query_row(
             "SELECT COUNT(*) FROM metric_samples WHERE ts >= ?",
             params![ts],
@@ -127,6 +133,24 @@ pub fn count_metric_samples_with_conn(conn: &Connection, since_ts: Option<f64>)
     Ok(count as usize)
 }
 
+/// A lower bound at or before the epoch matches every stored row, so it is
+/// dropped and the query runs without a `ts >= ?` comparison. All-time
+/// timeframes already pass `None`; this also covers windows reaching back
+/// further than 1970 (e.g. `--months 1000`).
+fn effective_since(since_ts: Option<f64>) -> Option<f64> {
+    since_ts.filter(|ts| *ts > 0.0)
+}
+
+/// Cheap emptiness probe: `EXISTS` stops at the first row instead of
+/// counting the whole table like [`count_metric_samples_with_conn`].
+pub fn has_metric_samples_with_conn(conn: &Connection) -> Result<bool> {
+    let exists: bool =
+        conn.query_row("SELECT EXISTS(SELECT 1 FROM metric_samples)", [], |row| {
+            row.get(0)
+        })?;
+    Ok(exists)
+}
+
 /// Deletes every metric sample with `ts < now_secs - prune_days*86400`.
 /// Returns the number of removed rows.
 pub fn prune_older_than_days_with_conn(conn: &Connection, prune_days: u64) -> Result<usize> {
@@ -139,27 +163,103 @@ pub fn prune_older_than_days_with_conn(conn: &Connection, prune_days: u64) -> Re
     Ok(removed)
 }
 
+/// Growth since the last `ANALYZE` after which [`optimize_with_conn`] treats
+/// the statistics as stale.
+const STATS_STALE_GROWTH: i64 = 10;
+
+/// Refreshes planner statistics from the writer. Without `sqlite_stat1` the
+/// planner has to guess between `idx_metric_samples_ts` and
+/// `idx_metric_samples_kind_ts` for the report's `ts >= ? AND kind IN (...)`
+/// range scan.
+///
+/// `PRAGMA optimize` only analyzes tables whose indexes the planner used on
+/// the same connection, which the collector's inserts never do, so staleness
+/// is judged here instead: the table is analyzed when it has no statistics
+/// yet or has grown [`STATS_STALE_GROWTH`]-fold since they were recorded.
+/// The current size is estimated from the rowid span (two index seeks, since
+/// pruning only removes the oldest rows), and `analysis_limit` keeps the
+/// `ANALYZE` itself cheap on a large table.
+pub fn optimize_with_conn(conn: &Connection) -> Result<()> {
+    let has_stats_table: bool = conn.query_row(
+        "SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1')",
+        [],
+        |row| row.get(0),
+    )?;
+    let recorded_rows = if has_stats_table {
+        let stat: Option<String> = conn.query_row(
+            "SELECT (SELECT stat FROM sqlite_stat1 \
+             WHERE tbl = 'metric_samples' AND idx = 'idx_metric_samples_ts')",
+            [],
+            |row| row.get(0),
+        )?;
+        stat.and_then(|stat| stat.split(' ').next()?.parse::<i64>().ok())
+    } else {
+        None
+    };
+    let current_rows: i64 = conn.query_row(
+        "SELECT COALESCE((SELECT MAX(rowid) FROM metric_samples) \
+         - (SELECT MIN(rowid) FROM metric_samples) + 1, 0)",
+        [],
+        |row| row.get(0),
+    )?;
+
+    let stale = match recorded_rows {
+        Some(rows) => current_rows >= rows.max(1) * STATS_STALE_GROWTH,
+        None => true,
+    };
+    if stale {
+        conn.execute_batch("PRAGMA analysis_limit=1000; ANALYZE metric_samples;")?;
+    }
+    Ok(())
+}
+
+/// Per-connection tuning for the report's single large read. A 64 MiB page
+/// cache and a 256 MiB memory map serve long windows without a `read()` per
+/// page, temp B-trees (the `ORDER BY ts` sort when the planner picks the kind
+/// index) stay in memory, and `query_only` keeps the connection read-only once
+/// [`init_db_connection`] has finished its setup writes. Nothing on the report
+/// path lifts it again; planner statistics are maintained by the collector
+/// through [`optimize_with_conn`].
+pub fn tune_for_reads_with_conn(conn: &Connection) -> Result<()> {
+    conn.pragma_update(None, "cache_size", -65_536)?;
+    conn.pragma_update(None, "mmap_size", 268_435_456)?;
+    conn.pragma_update(None, "temp_store", "MEMORY")?;
+    conn.pragma_update(None, "query_only", "ON")?;
+    Ok(())
+}
+
+/// Column list shared by every sample query, in the positional order
+/// [`metric_from_row`] reads. Selecting by index skips rusqlite's per-column
+/// name lookup, which otherwise runs six times for every fetched row.
+const SAMPLE_COLUMNS: &str = "ts, kind, source, value, unit, details";
+
 /// One row mapped to a sample. Rows whose `kind` doesn't parse (legacy or
 /// corrupt entries after an upgrade) are dropped with a warning rather than
 /// aborting the whole report — see [`map_row_skipping_unknown`].
+///
+/// `kind` and `details` are read as borrowed text so neither allocates an
+/// intermediate `String` before parsing.
 fn metric_from_row(row: &Row) -> rusqlite::Result<Option<MetricSample>> {
-    let kind_raw: String = row.get("kind")?;
-    let Some(kind) = MetricKind::from_str(&kind_raw).ok() else {
+    let kind_raw = row.get_ref(1)?.as_str().unwrap_or_default();
+    let Ok(kind) = MetricKind::from_str(kind_raw) else {
         log::warn!("skipping metric row with unknown kind `{kind_raw}`");
         return Ok(None);
     };
-    let details_raw: Option<String> = row.get("details")?;
-    let details = match details_raw {
-        Some(text) => serde_json::from_str(&text).unwrap_or(serde_json::Value::Null),
-        None => serde_json::Value::Null,
+    let details = match row.get_ref(5)? {
+        ValueRef::Null => serde_json::Value::Null,
+        raw => raw
+            .as_str()
+            .ok()
+            .and_then(|text| serde_json::from_str(text).ok())
+            .unwrap_or(serde_json::Value::Null),
     };
 
     Ok(Some(MetricSample {
-        ts: row.get("ts")?,
+        ts: row.get(0)?,
         kind,
-        source: row.get::<_, String>("source")?,
-        value: row.get("value")?,
-        unit: row.get::<_, Option<String>>("unit")?,
+        source: row.get(2)?,
+        value: row.get(3)?,
+        unit: row.get(4)?,
         details,
     }))
 }
@@ -179,47 +279,30 @@ pub fn fetch_metric_samples_with_conn(
     since_ts: Option<f64>,
     kinds: Option<&[MetricKind]>,
 ) -> Result<Vec<MetricSample>> {
-    let kind_placeholders = kinds.map(|k| k.iter().map(|_| "?").collect::<Vec<_>>().join(", "));
-
-    let (sql, params_vec): (String, Vec<Box<dyn rusqlite::types::ToSql>>) =
-        match (since_ts, &kind_placeholders) {
-            (Some(_), Some(ph)) => (
-                format!(
-                    "SELECT * FROM metric_samples WHERE ts >= ? AND kind IN ({ph}) ORDER BY ts"
-                ),
-                {
-                    let mut v: Vec<Box<dyn rusqlite::types::ToSql>> =
-                        vec![Box::new(since_ts.unwrap())];
-                    for k in kinds.unwrap() {
-                        v.push(Box::new(k.as_str().to_string()));
-                    }
-                    v
-                },
-            ),
-            (Some(ts), None) => (
-                "SELECT * FROM metric_samples WHERE ts >= ? ORDER BY ts".to_string(),
-                vec![Box::new(ts)],
-            ),
-            (None, Some(ph)) => (
-                format!("SELECT * FROM metric_samples WHERE kind IN ({ph}) ORDER BY ts"),
-                {
-                    let mut v: Vec<Box<dyn rusqlite::types::ToSql>> = Vec::new();
-                    for k in kinds.unwrap() {
-                        v.push(Box::new(k.as_str().to_string()));
-                    }
-                    v
-                },
-            ),
-            (None, None) => (
-                "SELECT * FROM metric_samples ORDER BY ts".to_string(),
-                Vec::new(),
-            ),
-        };
-
+    let mut conditions = Vec::new();
+    let mut params_vec: Vec<Box<dyn rusqlite::types::ToSql>> = Vec::new();
+    if let Some(ts) = effective_since(since_ts) {
+        conditions.push("ts >= ?".to_string());
+        params_vec.push(Box::new(ts));
+    }
+    if let Some(kinds) = kinds {
+        let placeholders = kinds.iter().map(|_| "?").collect::<Vec<_>>().join(", ");
+        conditions.push(format!("kind IN ({placeholders})"));
+        for kind in kinds {
+            params_vec.push(Box::new(kind.as_str()));
+        }
+    }
+    let filter = if conditions.is_empty() {
+        String::new()
+    } else {
+        format!(" WHERE {}", conditions.join(" AND "))
+    };
     let to_sql_refs: Vec<&dyn rusqlite::types::ToSql> =
         params_vec.iter().map(|b| b.as_ref()).collect();
 
-    let mut stmt = conn.prepare(&sql)?;
+    let mut stmt = conn.prepare(&format!(
+        "SELECT {SAMPLE_COLUMNS} FROM metric_samples{filter} ORDER BY ts"
+    ))?;
     let rows = stmt.query_map(
         rusqlite::params_from_iter(to_sql_refs.iter()),
         metric_from_row,
@@ -256,7 +339,7 @@ pub fn fetch_latest_metric_samples_with_conn(
     };
 
     let sql = format!(
-        "SELECT m.* FROM metric_samples m \
+        "SELECT m.ts, m.kind, m.source, m.value, m.unit, m.details FROM metric_samples m \
          INNER JOIN ( \
              SELECT kind, source, MAX(ts) as max_ts \
              FROM metric_samples \
@@ -420,6 +503,133 @@ mod tests {
         assert_eq!(rows[0].kind, MetricKind::CpuUsage);
     }
 
+    #[test]
+    fn repeated_inserts_reuse_one_connection() {
+        let tmp = tempfile::tempdir().unwrap();
+        let db_path = tmp.path().join("reuse.db");
+        let mut conn = init_db_connection(&db_path).unwrap();
+
+        for ts in [1.0, 2.0, 3.0] {
+            let sample = MetricSample {
+                ts,
+                kind: MetricKind::CpuUsage,
+                source: "cpu".to_string(),
+                value: Some(ts * 10.0),
+                unit: Some("%".to_string()),
+                details: serde_json::Value::Null,
+            };
+            insert_metric_samples_with_conn(&mut conn, &[sample]).unwrap();
+        }
+
+        assert_eq!(count_metric_samples_with_conn(&conn, None).unwrap(), 3);
+        let fetched = fetch_metric_samples_with_conn(&conn, Some(2.0), None).unwrap();
+        assert_eq!(fetched.len(), 2);
+        optimize_with_conn(&conn).unwrap();
+    }
+
+    #[test]
+    fn non_positive_since_matches_every_row() {
+        let tmp = tempfile::tempdir().unwrap();
+        let db_path = tmp.path().join("since.db");
+        let mut conn = init_db_connection(&db_path).unwrap();
+        let samples: Vec<MetricSample> = [10.0, 20.0]
+            .into_iter()
+            .map(|ts| MetricSample {
+                ts,
+                kind: MetricKind::CpuUsage,
+                source: "cpu".to_string(),
+                value: Some(1.0),
+                unit: None,
+                details: serde_json::Value::Null,
+            })
+            .collect();
+        insert_metric_samples_with_conn(&mut conn, &samples).unwrap();
+
+        assert_eq!(effective_since(Some(-5.0)), None);
+        assert_eq!(effective_since(Some(15.0)), Some(15.0));
+        assert_eq!(count_metric_samples_with_conn(&conn, Some(0.0)).unwrap(), 2);
+        let fetched = fetch_metric_samples_with_conn(&conn, Some(-1.0e9), None).unwrap();
+        assert_eq!(fetched.len(), 2);
+    }
+
+    #[test]
+    fn read_tuned_connection_still_reads_but_rejects_writes() {
+        let tmp = tempfile::tempdir().unwrap();
+        let db_path = tmp.path().join("reads.db");
+        let mut conn = init_db_connection(&db_path).unwrap();
+        let sample = MetricSample {
+            ts: 1.0,
+            kind: MetricKind::CpuUsage,
+            source: "cpu".to_string(),
+            value: Some(5.0),
+            unit: Some("%".to_string()),
+            details: serde_json::Value::Null,
+        };
+        insert_metric_samples_with_conn(&mut conn, std::slice::from_ref(&sample)).unwrap();
+
+        tune_for_reads_with_conn(&conn).unwrap();
+
+        let cache_size: i64 = conn
+            .query_row("PRAGMA cache_size", [], |row| row.get(0))
+            .unwrap();
+        assert_eq!(cache_size, -65_536);
+        assert_eq!(
+            fetch_metric_samples_with_conn(&conn, None, None)
+                .unwrap()
+                .len(),
+            1
+        );
+        assert!(insert_metric_samples_with_conn(&mut conn, &[sample]).is_err());
+        assert!(conn.execute_batch("ANALYZE metric_samples;").is_err());
+    }
+
+    #[test]
+    fn optimize_populates_planner_stats_from_writer() {
+        let tmp = tempfile::tempdir().unwrap();
+        let db_path = tmp.path().join("stats.db");
+        let mut conn = init_db_connection(&db_path).unwrap();
+        let samples: Vec<MetricSample> = (1..=3)
+            .map(|i| MetricSample {
+                ts: i as f64,
+                kind: MetricKind::CpuUsage,
+                source: "cpu".to_string(),
+                value: Some(5.0),
+                unit: Some("%".to_string()),
+                details: serde_json::Value::Null,
+            })
+            .collect();
+        insert_metric_samples_with_conn(&mut conn, &samples).unwrap();
+        optimize_with_conn(&conn).unwrap();
+
+        let analyzed: i64 = conn
+            .query_row(
+                "SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 'metric_samples'",
+                [],
+                |row| row.get(0),
+            )
+            .unwrap();
+        assert!(analyzed > 0);
+
+        let recorded = |conn: &Connection| -> String {
+            conn.query_row(
+                "SELECT stat FROM sqlite_stat1 WHERE idx = 'idx_metric_samples_ts'",
+                [],
+                |row| row.get(0),
+            )
+            .unwrap()
+        };
+        assert!(recorded(&conn).starts_with("3 "));
+        // Fresh statistics are left alone; tenfold growth refreshes them.
+        insert_metric_samples_with_conn(&mut conn, &samples).unwrap();
+        optimize_with_conn(&conn).unwrap();
+        assert!(recorded(&conn).starts_with("3 "));
+        for _ in 0..9 {
+            insert_metric_samples_with_conn(&mut conn, &samples).unwrap();
+        }
+        optimize_with_conn(&conn).unwrap();
+        assert!(recorded(&conn).starts_with("33 "));
+    }
+
     #[test]
     fn stamping_user_version_is_idempotent() {
         let tmp = tempfile::tempdir().unwrap();
@@ -509,7 +719,10 @@ mod tests {
                 details: serde_json::Value::Null,
             },
         ];
+        let conn = Connection::open(&db_path).unwrap();
+        assert!(!has_metric_samples_with_conn(&conn).unwrap());
         insert_metric_samples(&db_path, &samples).unwrap();
+        assert!(has_metric_samples_with_conn(&conn).unwrap());
         assert_eq!(count_metric_samples(&db_path, None).unwrap(), 2);
 
         let removed =
@@ -8,7 +8,10 @@ use plotters::coord::Shift;
 use plotters::prelude::*;
 use plotters::series::LineSeries;
 
-use crate::cli_helpers::{bucket_span_seconds, bucket_start, MAX_GAP_SECONDS};
+use crate::cli_helpers::{
+    bucket_datetime, bucket_span_seconds, counter_delta, data_span_seconds, detail_number,
+    BucketAligner, SamplesByKind, MAX_GAP_SECONDS,
+};
 use crate::metrics::{MetricKind, MetricSample, ReportPreset};
 use crate::timeframe::Timeframe;
 
@@ -59,14 +62,14 @@ fn build_charts(
     timeframe: &Timeframe,
     bucket_seconds: i64,
 ) -> Vec<ChartSpec> {
+    let samples = SamplesByKind::new(metrics);
     let mut charts = Vec::new();
     let label = timeframe.label.replace('_', " ");
 
     if presets.contains(&ReportPreset::Battery) {
         let mut series = Vec::new();
         let percent_points = bucket_mean_series(
-            metrics,
-            MetricKind::BatteryPercentage,
+            samples.of(MetricKind::BatteryPercentage),
             bucket_seconds,
             |v, _| v,
         );
@@ -76,8 +79,11 @@ fn build_charts(
                 points: percent_points,
             });
         }
-        let health_points =
-            bucket_mean_series(metrics, MetricKind::BatteryHealth, bucket_seconds, |v, _| v);
+        let health_points = bucket_mean_series(
+            samples.of(MetricKind::BatteryHealth),
+            bucket_seconds,
+            |v, _| v,
+        );
         if !health_points.is_empty() {
             series.push(MetricSeries {
                 label: "Health %".to_string(),
@@ -93,7 +99,7 @@ fn build_charts(
         }
 
         let power_draw =
-            bucket_mean_series(metrics, MetricKind::PowerDraw, bucket_seconds, |v, _| v);
+            bucket_mean_series(samples.of(MetricKind::PowerDraw), bucket_seconds, |v, _| v);
         if !power_draw.is_empty() {
             charts.push(ChartSpec {
                 title: format!("Power draw ({label})"),
@@ -107,8 +113,11 @@ fn build_charts(
     }
 
     if presets.contains(&ReportPreset::Cpu) {
-        let usage =
-            bucket_mean_series_by_source(metrics, MetricKind::CpuUsage, bucket_seconds, |v, _| v);
+        let usage = bucket_mean_series_by_source(
+            samples.of(MetricKind::CpuUsage),
+            bucket_seconds,
+            |v, _| v,
+        );
         if !usage.is_empty() {
             charts.push(ChartSpec {
                 title: format!("CPU usage ({label})"),
@@ -117,8 +126,7 @@ fn build_charts(
             });
         }
         let freq = bucket_mean_series_by_source(
-            metrics,
-            MetricKind::CpuFrequency,
+            samples.of(MetricKind::CpuFrequency),
             bucket_seconds,
             |v, _| v,
         );
@@ -132,8 +140,11 @@ fn build_charts(
     }
 
     if presets.contains(&ReportPreset::Gpu) {
-        let usage =
-            bucket_mean_series_by_source(metrics, MetricKind::GpuUsage, bucket_seconds, |v, _| v);
+        let usage = bucket_mean_series_by_source(
+            samples.of(MetricKind::GpuUsage),
+            bucket_seconds,
+            |v, _| v,
+        );
         if !usage.is_empty() {
             charts.push(ChartSpec {
                 title: format!("GPU usage ({label})"),
@@ -142,8 +153,7 @@ fn build_charts(
             });
         }
         let freq = bucket_mean_series_by_source(
-            metrics,
-            MetricKind::GpuFrequency,
+            samples.of(MetricKind::GpuFrequency),
             bucket_seconds,
             |v, _| v,
         );
@@ -158,8 +168,7 @@ fn build_charts(
 
     if presets.contains(&ReportPreset::Memory) {
         let memory = bucket_mean_series(
-            metrics,
-            MetricKind::MemoryUsage,
+            samples.of(MetricKind::MemoryUsage),
             bucket_seconds,
             |used, _| bytes_to_gib(used),
         );
@@ -176,9 +185,11 @@ fn build_charts(
     }
 
     if presets.contains(&ReportPreset::Disk) {
-        let disk = bucket_mean_series(metrics, MetricKind::DiskUsage, bucket_seconds, |used, _| {
-            bytes_to_gib(used)
-        });
+        let disk = bucket_mean_series(
+            samples.of(MetricKind::DiskUsage),
+            bucket_seconds,
+            |used, _| bytes_to_gib(used),
+        );
         if !disk.is_empty() {
             charts.push(ChartSpec {
                 title: format!("Disk usage ({label})"),
@@ -192,7 +203,7 @@ fn build_charts(
     }
 
     if presets.contains(&ReportPreset::Network) {
-        let (rx, tx) = network_bucket_series(metrics, bucket_seconds);
+        let (rx, tx) = network_bucket_series(samples.of(MetricKind::NetworkBytes), bucket_seconds);
         let mut series = Vec::new();
         if !rx.is_empty() {
             series.push(MetricSeries {
@@ -217,8 +228,7 @@ fn build_charts(
 
     if presets.contains(&ReportPreset::Temperature) {
         let temps = bucket_mean_series_by_source(
-            metrics,
-            MetricKind::Temperature,
+            samples.of(MetricKind::Temperature),
             bucket_seconds,
             |v, _| v,
         );
@@ -239,40 +249,9 @@ fn plot_chart(
     chart: &ChartSpec,
     bucket_seconds: i64,
 ) -> Result<()> {
-    let mut all_points: SeriesPoints = Vec::new();
-    for series in &chart.series {
-        all_points.extend_from_slice(&series.points);
-    }
-
-    let Some(min_ts) = all_points.iter().map(|(ts, _)| *ts).min() else {
+    let Some((min_ts, max_ts, y_min, y_max)) = chart_bounds(chart) else {
         return Ok(());
     };
-    let Some(max_ts) = all_points.iter().map(|(ts, _)| *ts).max() else {
-        return Ok(());
-    };
-
-    // Guard against degenerate x-range (single bucket). plotters' coordinate
-    // builder does not handle zero-width ranges; pad by ±60s.
-    let (min_ts, max_ts) = if max_ts == min_ts {
-        let pad = TimeDelta::seconds(60);
-        (min_ts - pad, max_ts + pad)
-    } else {
-        (min_ts, max_ts)
-    };
-
-    let mut min_y = f64::INFINITY;
-    let mut max_y = f64::NEG_INFINITY;
-    for (_, value) in &all_points {
-        min_y = min_y.min(*value);
-        max_y = max_y.max(*value);
-    }
-    if (max_y - min_y).abs() < 1e-6 {
-        min_y -= 1.0;
-        max_y += 1.0;
-    }
-    let padding = (max_y - min_y) * 0.05;
-    let y_min = min_y - padding;
-    let y_max = max_y + padding;
 
     let mut chart_ctx = ChartBuilder::on(&area)
         .caption(&chart.title, ("sans-serif", 20).into_font())
@@ -299,11 +278,11 @@ fn plot_chart(
         let mut segments = split_by_gaps(&series.points, bucket_seconds).into_iter();
         if let Some(first) = segments.next() {
             chart_ctx
-                .draw_series(LineSeries::new(first, &color))?
+                .draw_series(LineSeries::new(first.iter().copied(), &color))?
                 .label(series.label.clone())
                 .legend(move |(x, y)| PathElement::new(vec![(x, y), (x + 10, y)], color));
             for rest in segments {
-                chart_ctx.draw_series(LineSeries::new(rest, &color))?;
+                chart_ctx.draw_series(LineSeries::new(rest.iter().copied(), &color))?;
             }
         }
     }
@@ -317,6 +296,37 @@ fn plot_chart(
     Ok(())
 }
 
+/// Time and value ranges spanning every series of `chart`, gathered in one
+/// pass over the points without copying them into a combined list. Returns
+/// `None` when the chart has no points.
+fn chart_bounds(chart: &ChartSpec) -> Option<(DateTime<Local>, DateTime<Local>, f64, f64)> {
+    let mut points = chart.series.iter().flat_map(|series| &series.points);
+    let &(first_ts, first_value) = points.next()?;
+    let (mut min_ts, mut max_ts) = (first_ts, first_ts);
+    let (mut min_y, mut max_y) = (first_value, first_value);
+    for &(ts, value) in points {
+        min_ts = min_ts.min(ts);
+        max_ts = max_ts.max(ts);
+        min_y = min_y.min(value);
+        max_y = max_y.max(value);
+    }
+
+    // Guard against degenerate x-range (single bucket). plotters' coordinate
+    // builder does not handle zero-width ranges; pad by ±60s.
+    if max_ts == min_ts {
+        let pad = TimeDelta::seconds(60);
+        min_ts -= pad;
+        max_ts += pad;
+    }
+
+    if (max_y - min_y).abs() < 1e-6 {
+        min_y -= 1.0;
+        max_y += 1.0;
+    }
+    let padding = (max_y - min_y) * 0.05;
+    Some((min_ts, max_ts, min_y - padding, max_y + padding))
+}
+
 /// Splits a sorted point list into contiguous runs separated by gaps longer
 /// than the bucket width can bridge. Each returned Vec is suitable as input
 /// to one `LineSeries` so the line does not interpolate across the gap.
@@ -329,43 +339,54 @@ fn plot_chart(
 /// bucket width, larger buckets (15m / 6h) would always exceed the raw
 /// 10-minute cadence threshold and every run would collapse to a single
 /// point, producing an empty plot.
-fn split_by_gaps(points: &[(DateTime<Local>, f64)], bucket_seconds: i64) -> Vec<SeriesPoints> {
+///
+/// Runs are returned as sub-slices of `points`, so no point is copied.
+fn split_by_gaps(
+    points: &[(DateTime<Local>, f64)],
+    bucket_seconds: i64,
+) -> Vec<&[(DateTime<Local>, f64)]> {
     let threshold_secs = (MAX_GAP_SECONDS as i64).max(bucket_seconds.saturating_mul(2));
     let max_gap = TimeDelta::seconds(threshold_secs);
-    let mut out = Vec::new();
-    let mut current: SeriesPoints = Vec::new();
-    for point in points {
-        if let Some(last) = current.last() {
-            let dt = point.0.signed_duration_since(last.0);
-            if dt > max_gap {
-                // `current.last()` returning Some means current is non-empty.
-                out.push(std::mem::take(&mut current));
-            }
-        }
-        current.push(*point);
+    points
+        .chunk_by(|prev, next| next.0.signed_duration_since(prev.0) <= max_gap)
+        .collect()
+}
+
+/// Sum and count of the values landing in one bucket; a bucket only exists
+/// once a value was pushed, so `count` is never zero when read.
+#[derive(Default)]
+struct RunningMean {
+    sum: f64,
+    count: u32,
+}
+
+impl RunningMean {
+    fn push(&mut self, value: f64) {
+        self.sum += value;
+        self.count += 1;
     }
-    if !current.is_empty() {
-        out.push(current);
+
+    fn value(&self) -> f64 {
+        self.sum / f64::from(self.count)
     }
-    out
 }
 
-/// Averages all samples of `kind` into fixed-width local-time buckets. Empty
-/// buckets are absent from the output — that absence is what produces a gap
-/// when [`split_by_gaps`] walks the series.
-fn bucket_mean_series<F>(
-    metrics: &[MetricSample],
-    kind: MetricKind,
+/// Averages samples (all of one kind) into fixed-width local-time buckets.
+/// Empty buckets are absent from the output — that absence is what produces
+/// a gap when [`split_by_gaps`] walks the series.
+fn bucket_mean_series<'a, F>(
+    samples: impl IntoIterator<Item = &'a MetricSample>,
     bucket_seconds: i64,
     mut map_value: F,
 ) -> SeriesPoints
 where
     F: FnMut(f64, &MetricSample) -> f64,
 {
-    let mut grouped: BTreeMap<DateTime<Local>, Vec<f64>> = BTreeMap::new();
-    for sample in metrics.iter().filter(|m| m.kind == kind) {
+    let mut grouped: BTreeMap<i64, RunningMean> = BTreeMap::new();
+    let mut aligner = BucketAligner::new(bucket_seconds);
+    for sample in samples {
         if let Some(value) = sample.value {
-            let bucket = bucket_start(sample.ts, bucket_seconds);
+            let bucket = aligner.key(sample.ts);
             grouped
                 .entry(bucket)
                 .or_default()
@@ -374,29 +395,25 @@ where
     }
     grouped
         .into_iter()
-        .filter(|(_, values)| !values.is_empty())
-        .map(|(dt, values)| {
-            let avg = values.iter().sum::<f64>() / values.len() as f64;
-            (dt, avg)
-        })
+        .map(|(bucket, mean)| (bucket_datetime(bucket), mean.value()))
         .collect()
 }
 
 /// Same as [`bucket_mean_series`] but keeps one series per `source` (e.g. one
 /// line per CPU core / GPU / thermal zone).
-fn bucket_mean_series_by_source<F>(
-    metrics: &[MetricSample],
-    kind: MetricKind,
+fn bucket_mean_series_by_source<'a, F>(
+    samples: impl IntoIterator<Item = &'a MetricSample>,
     bucket_seconds: i64,
     mut map_value: F,
 ) -> Vec<MetricSeries>
 where
     F: FnMut(f64, &MetricSample) -> f64,
 {
-    let mut grouped: BTreeMap<String, BTreeMap<DateTime<Local>, Vec<f64>>> = BTreeMap::new();
-    for sample in metrics.iter().filter(|m| m.kind == kind) {
+    let mut grouped: BTreeMap<String, BTreeMap<i64, RunningMean>> = BTreeMap::new();
+    let mut aligner = BucketAligner::new(bucket_seconds);
+    for sample in samples {
         if let Some(value) = sample.value {
-            let bucket = bucket_start(sample.ts, bucket_seconds);
+            let bucket = aligner.key(sample.ts);
             grouped
                 .entry(sample.source.clone())
                 .or_default()
@@ -407,14 +424,10 @@ where
     }
     let mut series = Vec::new();
     for (source, buckets) in grouped {
-        let mut points = Vec::new();
-        for (dt, values) in buckets {
-            if values.is_empty() {
-                continue;
-            }
-            let avg = values.iter().sum::<f64>() / values.len() as f64;
-            points.push((dt, avg));
-        }
+        let points: SeriesPoints = buckets
+            .into_iter()
+            .map(|(bucket, mean)| (bucket_datetime(bucket), mean.value()))
+            .collect();
         if !points.is_empty() {
             series.push(MetricSeries {
                 label: source,
@@ -425,20 +438,18 @@ where
     series
 }
 
-fn network_bucket_series(
-    metrics: &[MetricSample],
+fn network_bucket_series<'a>(
+    samples: impl IntoIterator<Item = &'a MetricSample>,
     bucket_seconds: i64,
 ) -> (SeriesPoints, SeriesPoints) {
     let mut by_iface: BTreeMap<&str, Vec<&MetricSample>> = BTreeMap::new();
-    for sample in metrics
-        .iter()
-        .filter(|s| s.kind == MetricKind::NetworkBytes)
-    {
+    for sample in samples {
         by_iface.entry(&sample.source).or_default().push(sample);
     }
 
-    let mut rx_buckets: BTreeMap<DateTime<Local>, f64> = BTreeMap::new();
-    let mut tx_buckets: BTreeMap<DateTime<Local>, f64> = BTreeMap::new();
+    let mut rx_buckets: BTreeMap<i64, f64> = BTreeMap::new();
+    let mut tx_buckets: BTreeMap<i64, f64> = BTreeMap::new();
+    let mut aligner = BucketAligner::new(bucket_seconds);
 
     for (_iface, mut samples) in by_iface {
         samples.sort_by(|a, b| a.ts.total_cmp(&b.ts));
@@ -468,7 +479,7 @@ fn network_bucket_series(
             );
 
             if rx_delta > 0.0 || tx_delta > 0.0 {
-                let bucket = bucket_start(next.ts, bucket_seconds);
+                let bucket = aligner.key(next.ts);
                 *rx_buckets.entry(bucket).or_insert(0.0) += rx_delta;
                 *tx_buckets.entry(bucket).or_insert(0.0) += tx_delta;
             }
@@ -477,55 +488,20 @@ fn network_bucket_series(
 
     let rx_series = rx_buckets
         .into_iter()
-        .map(|(bucket, total)| (bucket, total / 1_048_576.0))
+        .map(|(bucket, total)| (bucket_datetime(bucket), total / 1_048_576.0))
         .collect();
     let tx_series = tx_buckets
         .into_iter()
-        .map(|(bucket, total)| (bucket, total / 1_048_576.0))
+        .map(|(bucket, total)| (bucket_datetime(bucket), total / 1_048_576.0))
         .collect();
 
     (rx_series, tx_series)
 }
 
-fn counter_delta(previous: Option<f64>, current: Option<f64>) -> f64 {
-    match (previous, current) {
-        (Some(prev), Some(next)) if next >= prev => next - prev,
-        _ => 0.0,
-    }
-}
-
-fn detail_number(sample: &MetricSample, key: &str) -> Option<f64> {
-    sample
-        .details
-        .get(key)
-        .and_then(|v| v.as_f64().or_else(|| v.as_i64().map(|i| i as f64)))
-}
-
 fn bytes_to_gib(used: f64) -> f64 {
     used / (1024.0 * 1024.0 * 1024.0)
 }
 
-/// Span (max−min ts) of the provided samples, used to choose a bucket width
-/// consistent with the printed report tables.
-fn data_span_seconds(metrics: &[MetricSample]) -> Option<f64> {
-    let mut min = f64::INFINITY;
-    let mut max = f64::NEG_INFINITY;
-    let mut any = false;
-    for m in metrics {
-        if m.ts < min {
-            min = m.ts;
-            any = true;
-        }
-        if m.ts > max {
-            max = m.ts;
-        }
-    }
-    if !any {
-        return None;
-    }
-    Some(max - min)
-}
-
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -551,7 +527,7 @@ mod tests {
             metric_sample("cpu1", 0.0, 20.0, MetricKind::CpuUsage),
             metric_sample("cpu0", 60.0, 30.0, MetricKind::CpuUsage),
         ];
-        let series = bucket_mean_series_by_source(&metrics, MetricKind::CpuUsage, 5 * 60, |v, _| v);
+        let series = bucket_mean_series_by_source(&metrics, 5 * 60, |v, _| v);
         assert_eq!(series.len(), 2);
         let cpu0 = series.iter().find(|s| s.label == "cpu0").unwrap();
         let cpu1 = series.iter().find(|s| s.label == "cpu1").unwrap();
@@ -591,6 +567,36 @@ mod tests {
         assert_eq!(runs[0].len(), 3);
     }
 
+    #[test]
+    fn chart_bounds_span_all_series() {
+        let base = chrono::Local.timestamp_opt(0, 0).single().unwrap();
+        let chart = ChartSpec {
+            title: "test".to_string(),
+            y_desc: "value".to_string(),
+            series: vec![
+                MetricSeries {
+                    label: "a".to_string(),
+                    points: vec![(base + TimeDelta::seconds(60), 10.0)],
+                },
+                MetricSeries {
+                    label: "b".to_string(),
+                    points: vec![(base, 30.0), (base + TimeDelta::seconds(120), 20.0)],
+                },
+            ],
+        };
+        let (min_ts, max_ts, y_min, y_max) = chart_bounds(&chart).unwrap();
+        assert_eq!(min_ts, base);
+        assert_eq!(max_ts, base + TimeDelta::seconds(120));
+        assert!((y_min - 9.0).abs() < 1e-9);
+        assert!((y_max - 31.0).abs() < 1e-9);
+
+        let empty = ChartSpec {
+            series: Vec::new(),
+            ..chart
+        };
+        assert!(chart_bounds(&empty).is_none());
+    }
+
     #[test]
     fn split_by_gaps_breaks_exactly_at_threshold() {
         let base = chrono::Local.timestamp_opt(0, 0).single().unwrap();
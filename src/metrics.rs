@@ -12,6 +12,8 @@ use serde::{Deserialize, Serialize};
 use serde_json::{json, Value};
 use strum::{Display, EnumIter, EnumString, IntoEnumIterator};
 
+use crate::sysfs::read_float;
+
 /// Preset groupings selected via `symmetri report --preset`. Lives in the
 /// metrics domain layer rather than `cli` so chart/report code can depend on
 /// it without reaching into the CLI module.
@@ -226,11 +228,6 @@ fn cpu_usage_samples(ts: f64) -> Vec<MetricSample> {
     samples
 }
 
-fn read_numeric(path: &Path) -> Option<f64> {
-    let raw = fs::read_to_string(path).ok()?;
-    raw.trim().parse::<f64>().ok()
-}
-
 fn cpu_frequency_samples(ts: f64) -> Vec<MetricSample> {
     let root = Path::new("/sys/devices/system/cpu");
     let entries = match fs::read_dir(root) {
@@ -247,7 +244,7 @@ fn cpu_frequency_samples(ts: f64) -> Vec<MetricSample> {
             continue;
         }
         let freq_path = entry.path().join("cpufreq").join("scaling_cur_freq");
-        if let Some(khz) = read_numeric(&freq_path) {
+        if let Some(khz) = read_float(&freq_path) {
             let mhz = khz / 1000.0;
             samples.push(MetricSample::new(
                 ts,
@@ -419,10 +416,7 @@ fn temperature_samples(ts: f64) -> Vec<MetricSample> {
                 .map(|s| s.trim().to_string())
                 .filter(|s| !s.is_empty())
                 .unwrap_or_else(|| entry.file_name().to_string_lossy().to_string());
-            let temp_mc = match fs::read_to_string(path.join("temp"))
-                .ok()
-                .and_then(|s| s.trim().parse::<f64>().ok())
-            {
+            let temp_mc = match read_float(&path.join("temp")) {
                 Some(v) => v,
                 None => continue,
             };
@@ -461,10 +455,7 @@ fn temperature_samples(ts: f64) -> Vec<MetricSample> {
                 if !fname.starts_with("temp") || !fname.ends_with("_input") {
                     continue;
                 }
-                let temp_mc = match fs::read_to_string(sensor.path())
-                    .ok()
-                    .and_then(|s| s.trim().parse::<f64>().ok())
-                {
+                let temp_mc = match read_float(&sensor.path()) {
                     Some(v) => v,
                     None => continue,
                 };
@@ -529,7 +520,7 @@ fn gpu_samples(ts: f64) -> Vec<MetricSample> {
         let device = entry.path().join("device");
         let usage = ["gpu_busy_percent", "busy_percent", "gt_busy_percent"]
             .iter()
-            .find_map(|f| read_numeric(&device.join(f)));
+            .find_map(|f| read_float(&device.join(f)));
         if let Some(value) = usage {
             samples.push(MetricSample::new(
                 ts,
@@ -541,7 +532,7 @@ fn gpu_samples(ts: f64) -> Vec<MetricSample> {
             ));
         }
 
-        let freq = read_numeric(&device.join("gt_cur_freq_mhz"))
+        let freq = read_float(&device.join("gt_cur_freq_mhz"))
             .or_else(|| parse_pp_dpm_sclk(&device.join("pp_dpm_sclk")));
         if let Some(mhz) = freq {
             samples.push(MetricSample::new(
@@ -579,10 +570,7 @@ fn power_samples(ts: f64) -> Vec<MetricSample> {
             if !fname.starts_with("power") || !fname.ends_with("_input") {
                 continue;
             }
-            let raw_value = match fs::read_to_string(sensor.path())
-                .ok()
-                .and_then(|s| s.trim().parse::<f64>().ok())
-            {
+            let raw_value = match read_float(&sensor.path()) {
                 Some(v) => v,
                 None => continue,
             };
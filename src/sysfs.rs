@@ -1,5 +1,7 @@
+use std::cell::OnceCell;
 use std::collections::HashMap;
 use std::fs;
+use std::io::{self, Read};
 use std::path::{Path, PathBuf};
 
 use crate::metrics::{MetricKind, MetricSample};
@@ -7,7 +9,9 @@ use serde_json::json;
 
 #[derive(Debug, Clone)]
 pub struct BatteryReading {
-    pub path: PathBuf,
+    /// Device directory name (`BAT0`), used as the metric source. Resolved
+    /// once per read so metric creation and logging don't re-derive it.
+    pub name: String,
     pub capacity_pct: Option<f64>,
     pub percentage: Option<f64>,
     pub energy_now_wh: Option<f64>,
@@ -18,11 +22,7 @@ pub struct BatteryReading {
 }
 
 pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSample> {
-    let source = reading
-        .path
-        .file_name()
-        .map(|s| s.to_string_lossy().to_string())
-        .unwrap_or_else(|| reading.path.to_string_lossy().to_string());
+    let source = reading.name.as_str();
 
     let mut metrics = Vec::new();
     let details = json!({
@@ -33,7 +33,7 @@ pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSa
         metrics.push(MetricSample::new(
             ts,
             MetricKind::BatteryPercentage,
-            &source,
+            source,
             Some(percentage),
             Some("%"),
             details.clone(),
@@ -44,7 +44,7 @@ pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSa
         metrics.push(MetricSample::new(
             ts,
             MetricKind::BatteryCapacity,
-            &source,
+            source,
             Some(capacity),
             Some("%"),
             details.clone(),
@@ -55,7 +55,7 @@ pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSa
         metrics.push(MetricSample::new(
             ts,
             MetricKind::BatteryHealth,
-            &source,
+            source,
             Some(health),
             Some("%"),
             details.clone(),
@@ -66,7 +66,7 @@ pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSa
         metrics.push(MetricSample::new(
             ts,
             MetricKind::BatteryEnergyNow,
-            &source,
+            source,
             Some(energy),
             Some("Wh"),
             details.clone(),
@@ -77,7 +77,7 @@ pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSa
         metrics.push(MetricSample::new(
             ts,
             MetricKind::BatteryEnergyFull,
-            &source,
+            source,
             Some(energy),
             Some("Wh"),
             details.clone(),
@@ -88,7 +88,7 @@ pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSa
         metrics.push(MetricSample::new(
             ts,
             MetricKind::BatteryEnergyFullDesign,
-            &source,
+            source,
             Some(energy),
             Some("Wh"),
             details.clone(),
@@ -98,27 +98,55 @@ pub fn create_battery_metrics(reading: &BatteryReading, ts: f64) -> Vec<MetricSa
     metrics
 }
 
-fn parse_uevent(path: &Path) -> HashMap<String, String> {
-    let mut data = HashMap::new();
-    let content = fs::read_to_string(path.join("uevent")).unwrap_or_default();
-    for line in content.lines() {
-        if let Some((key, value)) = line.split_once('=') {
-            data.insert(key.to_string(), value.to_string());
+fn device_name(path: &Path) -> String {
+    path.file_name()
+        .map(|s| s.to_string_lossy().into_owned())
+        .unwrap_or_else(|| path.to_string_lossy().into_owned())
+}
+
+/// Splits `uevent` content into borrowed `KEY=value` pairs; the file is read
+/// once per battery and no per-line strings are allocated.
+fn parse_uevent(content: &str) -> HashMap<&str, &str> {
+    content
+        .lines()
+        .filter_map(|line| line.split_once('='))
+        .collect()
+}
+
+/// Attributes longer than this are read through `fs::read_to_string` instead
+/// of the stack buffer in [`with_attr`].
+const ATTR_BUF_LEN: usize = 128;
+
+/// Reads a small sysfs attribute and hands its trimmed text to `parse`.
+///
+/// `fs::read_to_string` probes the size with `statx` and, since sysfs reports
+/// every attribute as 4096 bytes, allocates a page-sized buffer per file.
+/// Attribute values are a handful of ASCII bytes, so they are read straight
+/// into a stack buffer instead; only an oversized file takes the slow path.
+pub(crate) fn with_attr<T>(path: &Path, parse: impl FnOnce(&str) -> Option<T>) -> Option<T> {
+    let mut file = fs::File::open(path).ok()?;
+    let mut buf = [0u8; ATTR_BUF_LEN];
+    let mut len = 0;
+    while len < buf.len() {
+        match file.read(&mut buf[len..]) {
+            Ok(0) => break,
+            Ok(n) => len += n,
+            Err(e) if e.kind() == io::ErrorKind::Interrupted => {}
+            Err(_) => return None,
         }
     }
-    data
+    if len == buf.len() {
+        let raw = fs::read_to_string(path).ok()?;
+        return parse(raw.trim());
+    }
+    parse(std::str::from_utf8(&buf[..len]).ok()?.trim())
 }
 
-fn read_float(path: &Path) -> Option<f64> {
-    let raw = fs::read_to_string(path).ok()?;
-    let trimmed = raw.trim();
-    if trimmed.is_empty() {
-        return None;
-    }
-    trimmed.parse::<f64>().ok()
+pub(crate) fn read_float(path: &Path) -> Option<f64> {
+    with_attr(path, |raw| raw.parse::<f64>().ok())
 }
 
-fn float_from_uevent(uevent: &HashMap<String, String>, keys: &[&str]) -> Option<f64> {
+fn float_from_uevent(uevent: &HashMap<&str, &str>, keys: &[&str]) -> Option<f64> {
     for key in keys {
         if let Some(raw) = uevent.get(*key) {
             if let Ok(value) = raw.parse::<f64>() {
@@ -130,13 +158,7 @@ fn float_from_uevent(uevent: &HashMap<String, String>, keys: &[&str]) -> Option<
 }
 
 fn read_str(path: &Path) -> Option<String> {
-    let raw = fs::read_to_string(path).ok()?;
-    let trimmed = raw.trim();
-    if trimmed.is_empty() {
-        None
-    } else {
-        Some(trimmed.to_string())
-    }
+    with_attr(path, |raw| (!raw.is_empty()).then(|| raw.to_string()))
 }
 
 fn wh_from_energy(raw_value: Option<f64>) -> Option<f64> {
@@ -150,7 +172,7 @@ fn energy_wh_from_charge(charge_uah: Option<f64>, voltage_uv: Option<f64>) -> Op
     }
 }
 
-fn read_voltage(path: &Path, uevent: &HashMap<String, String>) -> Option<f64> {
+fn read_voltage(path: &Path, uevent: &HashMap<&str, &str>) -> Option<f64> {
     float_from_uevent(
         uevent,
         &[
@@ -181,73 +203,63 @@ pub fn find_battery_paths(sysfs_root: &Path) -> Vec<PathBuf> {
         // requiring a `BAT*` name. Some firmwares expose batteries as
         // `macsmc-battery`, `BMS`, etc., which would be missed by the prefix.
         let type_file = path.join("type");
-        if let Ok(raw) = fs::read_to_string(&type_file) {
-            if raw.trim().eq_ignore_ascii_case("battery") {
-                batteries.push(path);
-            }
+        if with_attr(&type_file, |raw| Some(raw.eq_ignore_ascii_case("battery"))) == Some(true) {
+            batteries.push(path);
         }
     }
     batteries
 }
 
-pub fn read_battery(path: &Path) -> BatteryReading {
-    let uevent = parse_uevent(path);
-
-    let mut energy_now_raw = float_from_uevent(&uevent, &["POWER_SUPPLY_ENERGY_NOW"]);
-    if energy_now_raw.is_none() {
-        energy_now_raw = read_float(&path.join("energy_now"));
-    }
-
-    let mut energy_full_raw = float_from_uevent(&uevent, &["POWER_SUPPLY_ENERGY_FULL"]);
-    if energy_full_raw.is_none() {
-        energy_full_raw = read_float(&path.join("energy_full"));
-    }
-
-    let mut energy_full_design_raw =
-        float_from_uevent(&uevent, &["POWER_SUPPLY_ENERGY_FULL_DESIGN"]);
-    if energy_full_design_raw.is_none() {
-        energy_full_design_raw = read_float(&path.join("energy_full_design"));
-    }
-
-    let mut charge_now = float_from_uevent(&uevent, &["POWER_SUPPLY_CHARGE_NOW"]);
-    if charge_now.is_none() {
-        charge_now = read_float(&path.join("charge_now"));
-    }
-
-    let mut charge_full = float_from_uevent(&uevent, &["POWER_SUPPLY_CHARGE_FULL"]);
-    if charge_full.is_none() {
-        charge_full = read_float(&path.join("charge_full"));
-    }
+/// `uevent` value for `key`, opening the standalone attribute file only when
+/// the key is absent or unparsable: some drivers leave properties out of
+/// `uevent` while still exposing the file.
+fn uevent_or_attr(uevent: &HashMap<&str, &str>, path: &Path, key: &str, attr: &str) -> Option<f64> {
+    float_from_uevent(uevent, &[key]).or_else(|| read_float(&path.join(attr)))
+}
 
-    let mut charge_full_design = float_from_uevent(&uevent, &["POWER_SUPPLY_CHARGE_FULL_DESIGN"]);
-    if charge_full_design.is_none() {
-        charge_full_design = read_float(&path.join("charge_full_design"));
-    }
+pub fn read_battery(path: &Path) -> BatteryReading {
+    let uevent_content = fs::read_to_string(path.join("uevent")).unwrap_or_default();
+    let uevent = parse_uevent(&uevent_content);
+
+    // Charge counters and the voltage only matter for batteries that do not
+    // report energy directly, so they are looked up lazily: on energy-based
+    // batteries this skips six attribute opens that would fail anyway.
+    let voltage = OnceCell::new();
+    let energy_wh = |energy_key: &str, energy_attr: &str, charge_key: &str, charge_attr: &str| {
+        wh_from_energy(uevent_or_attr(&uevent, path, energy_key, energy_attr)).or_else(|| {
+            let charge = uevent_or_attr(&uevent, path, charge_key, charge_attr)?;
+            energy_wh_from_charge(
+                Some(charge),
+                *voltage.get_or_init(|| read_voltage(path, &uevent)),
+            )
+        })
+    };
 
-    let mut capacity_pct = float_from_uevent(&uevent, &["POWER_SUPPLY_CAPACITY"]);
-    if capacity_pct.is_none() {
-        capacity_pct = read_float(&path.join("capacity"));
-    }
+    let energy_now_wh = energy_wh(
+        "POWER_SUPPLY_ENERGY_NOW",
+        "energy_now",
+        "POWER_SUPPLY_CHARGE_NOW",
+        "charge_now",
+    );
+    let energy_full_wh = energy_wh(
+        "POWER_SUPPLY_ENERGY_FULL",
+        "energy_full",
+        "POWER_SUPPLY_CHARGE_FULL",
+        "charge_full",
+    );
+    let energy_full_design_wh = energy_wh(
+        "POWER_SUPPLY_ENERGY_FULL_DESIGN",
+        "energy_full_design",
+        "POWER_SUPPLY_CHARGE_FULL_DESIGN",
+        "charge_full_design",
+    );
+
+    let capacity_pct = uevent_or_attr(&uevent, path, "POWER_SUPPLY_CAPACITY", "capacity");
 
     let status = uevent
         .get("POWER_SUPPLY_STATUS")
-        .cloned()
+        .map(|s| s.to_string())
         .or_else(|| read_str(&path.join("status")));
-    let voltage = read_voltage(path, &uevent);
-
-    let mut energy_now_wh = wh_from_energy(energy_now_raw);
-    let mut energy_full_wh = wh_from_energy(energy_full_raw);
-    let mut energy_full_design_wh = wh_from_energy(energy_full_design_raw);
-
-    if energy_now_wh.is_none() {
-        energy_now_wh = energy_wh_from_charge(charge_now, voltage);
-    }
-    if energy_full_wh.is_none() {
-        energy_full_wh = energy_wh_from_charge(charge_full, voltage);
-    }
-    if energy_full_design_wh.is_none() {
-        energy_full_design_wh = energy_wh_from_charge(charge_full_design, voltage);
-    }
 
     let mut percentage = None;
     if let (Some(now), Some(full)) = (energy_now_wh, energy_full_wh) {
@@ -264,7 +276,7 @@ pub fn read_battery(path: &Path) -> BatteryReading {
     }
 
     BatteryReading {
-        path: path.to_path_buf(),
+        name: device_name(path),
         capacity_pct,
         percentage,
         energy_now_wh,
@@ -284,6 +296,21 @@ mod tests {
         fs::write(path, value).unwrap();
     }
 
+    #[test]
+    fn with_attr_trims_and_handles_oversized_files() {
+        let tmp = tempfile::tempdir().unwrap();
+        let small = tmp.path().join("energy_now");
+        write(&small, "45000000\n");
+        assert_eq!(read_float(&small), Some(45_000_000.0));
+
+        let large = tmp.path().join("large");
+        let value = "9".repeat(ATTR_BUF_LEN * 2);
+        write(&large, &format!("{value}\n"));
+        assert_eq!(read_str(&large).as_deref(), Some(value.as_str()));
+
+        assert_eq!(read_float(&tmp.path().join("missing")), None);
+    }
+
     #[test]
     fn find_battery_paths_filters_to_bat_devices() {
         let tmp = tempfile::tempdir().unwrap();
@@ -330,6 +357,7 @@ mod tests {
         write(&bat.join("status"), "Discharging\n");
 
         let reading = read_battery(&bat);
+        assert_eq!(reading.name, "BAT1");
         assert_eq!(reading.energy_now_wh, Some(40.0));
         assert_eq!(reading.energy_full_wh, Some(80.0));
         assert_eq!(reading.energy_full_design_wh, Some(90.0));
@@ -386,4 +414,20 @@ mod tests {
         assert_eq!(reading.capacity_pct, Some(85.0));
         assert_eq!(reading.status.as_deref(), Some("Discharging"));
     }
+
+    #[test]
+    fn read_battery_prefers_uevent_and_falls_back_per_key() {
+        let tmp = tempfile::tempdir().unwrap();
+        let bat = tmp.path().join("BAT3");
+        fs::create_dir(&bat).unwrap();
+        write(&bat.join("uevent"), "POWER_SUPPLY_ENERGY_NOW=20000000\n");
+        write(&bat.join("energy_now"), "10000000\n");
+        write(&bat.join("energy_full"), "40000000\n");
+        write(&bat.join("status"), "Charging\n");
+
+        let reading = read_battery(&bat);
+        assert_eq!(reading.energy_now_wh, Some(20.0));
+        assert_eq!(reading.energy_full_wh, Some(40.0));
+        assert_eq!(reading.status.as_deref(), Some("Charging"));
+    }
 }